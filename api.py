@@ -1,56 +1,186 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query, Depends, Header, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
+from typing import Callable, List, Optional
 import uvicorn
 import nest_asyncio
+import asyncio
+import json
+import math
 import os
+import threading
 import traceback
+import time
+import uuid
+
+from jobs import JobManager, JobQueueFull, RetryLater
+from serialization import CompressionMiddleware, FastJSONResponse, dumps, render
+from profiling import SamplingProfiler, merge_profiles, profile_call
+from engine import OFFLINE, engine_report, profile_name, settings as engine_settings
+from scheduler import (
+    BATCH, INTERACTIVE, ClientIdentity, FairScheduler, QuotaExceeded, UnknownAPIKey, estimate_tokens, identify_client
+)
 
 # Set your Hugging Face token directly here (REPLACE WITH YOUR ACTUAL TOKEN)
 from huggingface_hub import login
 os.environ["HUGGINGFACE_API_TOKEN"] = "Token_Here"
-login(token=os.environ["HUGGINGFACE_API_TOKEN"])
+if not OFFLINE:  # offline profiles never contact the Hub
+    login(token=os.environ["HUGGINGFACE_API_TOKEN"])
 
 # Define request model for better validation
 class ChatRequest(BaseModel):
     question: str
+    sources: Optional[List[str]] = None  # restrict retrieval to these document filenames
+    doc_type: Optional[str] = None  # restrict retrieval to one document type (e.g. "pdf")
+    session_id: Optional[str] = None  # conversation id, enables follow-up question condensation
+    corpus: Optional[str] = None  # named corpus to search (see GET /corpora), default corpus if omitted
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    sources: Optional[List[str]] = None
+    doc_type: Optional[str] = None
+    corpus: Optional[str] = None
+    max_concurrency: Optional[int] = None  # concurrent LLM calls, capped by BATCH_MAX_CONCURRENCY
+
+class ReloadIndexRequest(BaseModel):
+    path: Optional[str] = None  # ChromaDB directory of the new index, defaults to the active one
+
+class JobRequest(ChatRequest):
+    priority: int = 0  # higher values are processed first
+
+# Pool sizes come from the deployment profile (RAG_PROFILE, see engine.py)
+ENGINE_SETTINGS = engine_settings()
+
+# Batch limits (override with environment variables)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+BATCH_MAX_CONCURRENCY = ENGINE_SETTINGS["batch_max_concurrency"]
+
+# Job queue settings (override with environment variables)
+JOB_WORKERS = ENGINE_SETTINGS["job_workers"]
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "10000"))
+JOB_MAX_RESULTS = int(os.getenv("JOB_MAX_RESULTS", "1000"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_MAX_WAIT = 60.0
+
+# Questions in flight per WebSocket connection
+WS_MAX_IN_FLIGHT = ENGINE_SETTINGS["ws_max_in_flight"]
+
+# Per-client quotas and fair scheduling of LLM calls (see scheduler.py)
+API_KEYS = json.loads(os.getenv("RAG_API_KEYS", "{}"))  # {"api key": "client name"}
+REQUIRE_API_KEY = os.getenv("RAG_REQUIRE_API_KEY", "false").lower() == "true"
+# Tiers and weights apply to API-key clients only (by client name); anonymous clients are "batch"
+CLIENT_TIERS = json.loads(os.getenv("RAG_CLIENT_TIERS", '{"chainlit-ui": "interactive"}'))
+CLIENT_WEIGHTS = json.loads(os.getenv("RAG_CLIENT_WEIGHTS", "{}"))  # share within a tier, default 1
+CLIENT_REQUESTS_PER_MINUTE = int(os.getenv("RAG_CLIENT_REQUESTS_PER_MINUTE", "120"))
+CLIENT_TOKENS_PER_MINUTE = int(os.getenv("RAG_CLIENT_TOKENS_PER_MINUTE", "200000"))  # estimated LLM tokens
+LLM_SLOTS = ENGINE_SETTINGS["llm_slots"]
+JOB_MAX_PRIORITY = 10  # client-chosen job priorities are clamped to +/- this
+INTERACTIVE_JOB_PRIORITY = 100  # interactive jobs run before any batch job
+
+# Quota counters move to the shared state store once the engine has started
+scheduler = FairScheduler(LLM_SLOTS, CLIENT_REQUESTS_PER_MINUTE, CLIENT_TOKENS_PER_MINUTE)
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+SNAPSHOT_ON_SHUTDOWN = os.getenv("RAG_SNAPSHOT_ON_SHUTDOWN", "true").lower() == "true"
+
+# Profiling limits
+PROFILE_MAX_SECONDS = 120.0
+profile_lock = asyncio.Lock()
+
+# Responses smaller than this are not compressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
 
 # Initialize the RAG function with proper error handling
 rag_chat = None
+rag_chat_with_sources = None
+retrieve_documents_batch = None
+plan_answer = None
+call_llm = None
+plan_turn = None
+complete_turn = None
+stream_turn = None
+error_result = None
+list_sources = None
+list_corpora = None
+has_corpus = None
+state_store_stats = None
 rag_initialized = False
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only when it carries the configured admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def identify(headers, remote_host) -> ClientIdentity:
+    try:
+        return identify_client(headers, remote_host, API_KEYS, CLIENT_TIERS, CLIENT_WEIGHTS, REQUIRE_API_KEY)
+    except UnknownAPIKey as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+def client_identity(request: Request) -> ClientIdentity:
+    """Identify the caller by API key, or as an anonymous client by IP address"""
+    return identify(request.headers, request.client.host if request.client else None)
+
+async def admit(identity: ClientIdentity, tokens: int = 0, requests: int = 1):
+    """Charge the client's quotas or answer 429 with Retry-After"""
+    try:
+        await scheduler.admit_async(identity, tokens, requests)
+    except QuotaExceeded as e:
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if math.isfinite(e.retry_after) else None
+        raise HTTPException(status_code=429, detail=str(e), headers=headers)
+
+async def complete_with_slot(identity: ClientIdentity, plan: dict, complete: Optional[Callable] = None):
+    """
+    Finish a planned turn; only an actual LLM call is charged tokens and waits for a slot
+
+    The slot is awaited on the event loop before a worker thread is taken, so slot
+    holders never wait for threads and queued calls never hold one. `complete(plan)`
+    (default: complete_turn) runs on the worker thread while the slot is held.
+    """
+    if "result" in plan:
+        return plan["result"]
+    tokens = estimate_tokens(plan["messages"])
+    await admit(identity, tokens, requests=0)
+    async with scheduler.slot_async(identity, tokens):
+        return await run_in_threadpool(complete or complete_turn, plan)
+
+async def answer_turn(identity: ClientIdentity, question: str, **rag_kwargs) -> dict:
+    """Answer one chat turn: plan it on a worker thread, then call the LLM through the scheduler if needed"""
+    try:
+        plan = await run_in_threadpool(plan_turn, question, **rag_kwargs)
+        return await complete_with_slot(identity, plan)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return error_result(e)
+
 def initialize_rag():
     """Initialize RAG system on first request"""
-    global rag_chat, rag_initialized
+    global rag_chat, rag_chat_with_sources, retrieve_documents_batch, plan_answer, call_llm, plan_turn, complete_turn, stream_turn, error_result
+    global list_sources, list_corpora, has_corpus, state_store_stats, rag_initialized
     
     if rag_initialized:
         return True
     
     try:
+        print(f"Loading RAG engine (profile: {profile_name()})...")
+        from rag import (
+            rag_chat, rag_chat_with_sources, retrieve_documents_batch, plan_answer, call_llm,
+            plan_turn, complete_turn, stream_turn, error_result,
+            list_sources, list_corpora, has_corpus, state_store_stats, initialize_rag_system
+        )
         
-        print("Loading original RAG implementation...")
-        from rag import rag_chat, initialize_rag_system
-        print("✅ Original RAG loaded successfully")
-        
-        # Initialize the system
+        # Load the components selected by the deployment profile
         initialize_rag_system()
         
-        '''# Use optimized RAG for production, fallback to original for development
-        if os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("HUGGINGFACE_API_TOKEN"):
-            print("Loading optimized RAG implementation...")
-            from rag_optimized import rag_chat, initialize_rag_system
-            print("✅ Optimized RAG loaded successfully")
-            
-            # Initialize the system
-            if hasattr(locals().get('initialize_rag_system'), '__call__'):
-                initialize_rag_system()
-        else:
-            print("Loading original RAG implementation...")
-            from rag import rag_chat, initialize_rag_system
-            print("✅ Original RAG loaded successfully")
-            
-            # Initialize the system
-            initialize_rag_system()'''
-            
+        # Quotas are counted in the state store shared by all replicas
+        import rag
+        scheduler.store = rag.state_store
+        
         rag_initialized = True
         return True
         
@@ -66,7 +196,69 @@ except Exception as e:
     print(f"⚠️  Could not initialize RAG on startup: {e}")
     print("RAG will be initialized on first request.")
 
-app = FastAPI(title="RAG Chainlit API", description="AI Policy Assistant API")
+app = FastAPI(
+    title="RAG Chainlit API",
+    description="AI Policy Assistant API",
+    default_response_class=FastJSONResponse
+)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+def run_job(payload: dict) -> dict:
+    """Process a queued job on a worker thread"""
+    if not rag_initialized and not initialize_rag():
+        raise RuntimeError("Failed to initialize RAG system. Check server logs.")
+    identity = ClientIdentity.from_dict(payload["client"]) if payload.get("client") else ClientIdentity("jobs")
+    try:
+        plan = plan_turn(
+            payload["question"],
+            sources=payload.get("sources"),
+            doc_type=payload.get("doc_type"),
+            session_id=payload.get("session_id"),
+            corpus=payload.get("corpus")
+        )
+        if "result" in plan:
+            return plan["result"]
+        tokens = estimate_tokens(plan["messages"])
+        try:
+            scheduler.admit(identity, tokens, requests=0)
+        except QuotaExceeded as e:
+            if not math.isfinite(e.retry_after):
+                raise
+            # Never sleep on a worker: the job goes back to the queue until the quota window resets
+            raise RetryLater(e.retry_after, str(e))
+        with scheduler.slot(identity, tokens):
+            return complete_turn(plan)
+    except RetryLater:
+        raise
+    except Exception as e:
+        return error_result(e)
+
+job_manager = JobManager(
+    run_job,
+    workers=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    max_results=JOB_MAX_RESULTS,
+    result_ttl=JOB_RESULT_TTL
+)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    job_manager.stop()
+
+@app.on_event("shutdown")
+async def snapshot_on_shutdown():
+    """Save a warm-restart snapshot so the next boot skips index building"""
+    if not (SNAPSHOT_ON_SHUTDOWN and rag_initialized):
+        return
+    try:
+        from rag import save_engine_snapshot
+        save_engine_snapshot()
+    except Exception as e:
+        print(f"⚠️  Could not save snapshot on shutdown: {e}")
 
 @app.get("/")
 async def health_check():
@@ -76,11 +268,45 @@ async def health_check():
         "version": "1.0.0",
         "rag_loaded": rag_chat is not None,
         "rag_initialized": rag_initialized,
+        "jobs": job_manager.stats(),
+        "state_store": state_store_stats() if state_store_stats else None,
+        "engine": engine_report(),
+        "scheduler": scheduler.summary(),
         "environment": "production" if (os.getenv("RAILWAY_ENVIRONMENT") or os.getenv("HUGGINGFACE_API_TOKEN")) else "development"
     }
 
+def plan_and_encode(question: str, **rag_kwargs) -> dict:
+    """Plan a turn and serialize answers that need no LLM (profiled together so JSON cost is visible)"""
+    plan = plan_turn(question, **rag_kwargs)
+    if "result" in plan:
+        dumps(plan["result"])
+    return plan
+
+def complete_and_encode(plan: dict) -> dict:
+    """Run the planned LLM call and serialize its answer"""
+    result = complete_turn(plan)
+    dumps(result)
+    return result
+
+async def profiled_turn(identity: ClientIdentity, question: str, **rag_kwargs):
+    """
+    Answer a turn under cProfile: retrieval, the slot wait and the LLM call are reported as phases
+
+    Returns:
+        tuple: (result, merged profile)
+    """
+    plan, retrieval = await run_in_threadpool(profile_call, plan_and_encode, question, top=None, **rag_kwargs)
+    if "result" in plan:
+        return plan["result"], merge_profiles({"retrieval": retrieval})
+    start = time.perf_counter()
+    result, llm = await complete_with_slot(
+        identity, plan, lambda p: profile_call(complete_and_encode, p, top=None)
+    )
+    slot_wait = (time.perf_counter() - start) * 1000 - llm["wall_ms"]
+    return result, merge_profiles({"retrieval": retrieval, "slot_wait": max(slot_wait, 0.0), "llm": llm})
+
 @app.post("/chat")
-async def chat(chat_request: ChatRequest):
+async def chat(chat_request: ChatRequest, request: Request, identity: ClientIdentity = Depends(client_identity)):
     try:
         # Initialize RAG if not already done
         if not rag_initialized:
@@ -92,7 +318,7 @@ async def chat(chat_request: ChatRequest):
                 )
         
         # Check if RAG is properly loaded
-        if rag_chat is None:
+        if rag_chat_with_sources is None:
             raise HTTPException(
                 status_code=500, 
                 detail="RAG system not properly initialized. Check server logs for import errors."
@@ -103,17 +329,38 @@ async def chat(chat_request: ChatRequest):
         if not question:
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
-        print(f"Processing question: {question}")
+        if not has_corpus(chat_request.corpus):
+            raise HTTPException(status_code=404, detail=f"Unknown corpus '{chat_request.corpus}'")
+        
+        await admit(identity)
+        print(f"Processing question: {question} (client {identity.client_id})")
         
-        # Call the RAG function
-        answer = rag_chat(question)
+        rag_kwargs = {
+            "sources": chat_request.sources,
+            "doc_type": chat_request.doc_type,
+            "session_id": chat_request.session_id,
+            "corpus": chat_request.corpus
+        }
+        
+        # Opt-in deterministic profile of this single request (admin only)
+        profile = None
+        if request.headers.get("x-profile", "").lower() in ("1", "true", "yes"):
+            require_admin(request.headers.get("x-admin-token"))
+            result, profile = await profiled_turn(identity, question, **rag_kwargs)
+        else:
+            # Filters are pushed down into retrieval
+            result = await answer_turn(identity, question, **rag_kwargs)
+        answer = result["answer"]
         
         if not answer:
             answer = "I apologize, but I couldn't generate a response. Please try again."
         
         print(f"Generated answer: {answer[:100]}...")
         
-        return {"answer": answer}
+        payload = {**result, "answer": answer}  # extractive answers also carry "mode" and "confidence"
+        if profile is not None:
+            payload["profile"] = profile
+        return render(request, payload)
     
     except HTTPException:
         raise  # Re-raise HTTP exceptions
@@ -125,9 +372,338 @@ async def chat(chat_request: ChatRequest):
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.post("/chat/batch")
+async def chat_batch(batch_request: BatchChatRequest, identity: ClientIdentity = Depends(client_identity)):
+    """
+    Answer many questions in one request
+
+    Questions are embedded and retrieved in a single batched pass, then the LLM
+    calls run with bounded concurrency. Results are streamed back as NDJSON, one
+    line per question in completion order, each carrying its `index` and either
+    an `answer` or an `error`. Batches always run in the batch tier, count as one
+    request, and their LLM calls are paced by the client's token quota instead of
+    being rejected.
+    """
+    if not rag_initialized:
+        print("🔄 Initializing RAG system on first request...")
+        if not initialize_rag():
+            raise HTTPException(status_code=500, detail="Failed to initialize RAG system. Check server logs.")
+    
+    if retrieve_documents_batch is None or plan_answer is None:
+        raise HTTPException(status_code=500, detail="RAG system not properly initialized. Check server logs for import errors.")
+    
+    questions = [q.strip() for q in batch_request.questions]
+    if not questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"Too many questions (max {BATCH_MAX_QUESTIONS})")
+    if not has_corpus(batch_request.corpus):
+        raise HTTPException(status_code=404, detail=f"Unknown corpus '{batch_request.corpus}'")
+    
+    await admit(identity)
+    
+    concurrency = min(batch_request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    concurrency = max(concurrency, 1)
+    print(f"📦 Processing batch of {len(questions)} questions (concurrency={concurrency})")
+    
+    # One batched embedding call + one vectorized search for the whole batch
+    valid = [i for i, q in enumerate(questions) if q]
+    try:
+        retrieved = await run_in_threadpool(
+            retrieve_documents_batch,
+            [questions[i] for i in valid],
+            sources=batch_request.sources,
+            doc_type=batch_request.doc_type,
+            corpus=batch_request.corpus
+        )
+    except Exception as e:
+        print(f"❌ Error in batch retrieval: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    docs_by_index = dict(zip(valid, retrieved))
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    identity = identity.as_tier(BATCH)
+    
+    async def answer_one(index: int) -> dict:
+        question = questions[index]
+        if not question:
+            return {"index": index, "question": question, "error": "Question cannot be empty"}
+        async with semaphore:
+            try:
+                plan = await run_in_threadpool(plan_answer, question, docs_by_index[index])
+                if "result" not in plan:
+                    tokens = estimate_tokens(plan["messages"])
+                    await scheduler.wait_for_quota_async(identity, tokens)
+                    async with scheduler.slot_async(identity, tokens):
+                        plan = {"result": await run_in_threadpool(call_llm, plan)}
+                return {"index": index, "question": question, **plan["result"]}
+            except Exception as e:
+                print(f"❌ Error answering batch item {index}: {e}")
+                return {"index": index, "question": question, "error": str(e)}
+    
+    async def stream_results():
+        tasks = [asyncio.ensure_future(answer_one(i)) for i in range(len(questions))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield dumps(item) + b"\n"
+        finally:
+            # Client went away: stop dispatching LLM calls that have not started yet
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Persistent chat connection, one per conversation
+
+    Client messages (JSON):
+        {"id": "q1", "question": "...", "sources": [...], "doc_type": "...", "corpus": "..."}
+        {"type": "cancel", "id": "q1"}
+
+    Server messages carry the question `id`, so several questions can be in flight:
+    "sources", then "delta" chunks of the answer, then "done" (or "cancelled" / "error").
+    All questions share the connection's session (`?session_id=`, or a new one).
+    Cancelling a question or closing the connection aborts its upstream LLM stream.
+    """
+    try:
+        identity = identify(websocket.headers, websocket.client.host if websocket.client else None)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+    if not rag_initialized:
+        print("🔄 Initializing RAG system on first request...")
+        if not await run_in_threadpool(initialize_rag):
+            await websocket.close(code=1011, reason="Failed to initialize RAG system")
+            return
+
+    loop = asyncio.get_running_loop()
+    outgoing = asyncio.Queue()
+    cancels = {}  # question id -> threading.Event
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+
+    def emit(message: dict):
+        """Queue a message for the client (safe to call from worker threads)"""
+        loop.call_soon_threadsafe(outgoing.put_nowait, message)
+
+    def run_question(question_id, plan: dict, cancel: threading.Event):
+        for kind, payload in stream_turn(plan, cancel):
+            if kind == "sources":
+                emit({"id": question_id, "type": "sources", "sources": payload})
+            elif kind == "delta":
+                emit({"id": question_id, "type": "delta", "text": payload})
+            else:
+                emit({"id": question_id, "type": "done", **payload})
+        if cancel.is_set():
+            emit({"id": question_id, "type": "cancelled"})
+
+    async def answer(question_id, question: str, cancel: threading.Event, options: dict):
+        try:
+            plan = await run_in_threadpool(plan_turn, question, session_id=session_id, **options)
+            if "result" in plan:
+                await run_in_threadpool(run_question, question_id, plan, cancel)
+            else:
+                # Wait for the LLM slot here, before taking a worker thread
+                tokens = estimate_tokens(plan["messages"])
+                await scheduler.admit_async(identity, tokens, requests=0)
+                async with scheduler.slot_async(identity, tokens):
+                    await run_in_threadpool(run_question, question_id, plan, cancel)
+        except QuotaExceeded as e:
+            emit({"id": question_id, "type": "error", "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"❌ Error answering WebSocket question {question_id}: {e}")
+            emit({"id": question_id, "type": "error", "detail": str(e)})
+        finally:
+            cancels.pop(question_id, None)
+
+    async def send_messages():
+        while True:
+            message = await outgoing.get()
+            await websocket.send_text(dumps(message).decode("utf-8"))
+
+    sender = asyncio.ensure_future(send_messages())
+    await outgoing.put({"type": "session", "session_id": session_id})
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await outgoing.put({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+
+            question_id = data.get("id")
+            if question_id is not None and not isinstance(question_id, (str, int)):
+                await outgoing.put({"id": question_id, "type": "error", "detail": "id must be a string or an integer"})
+                continue
+            if data.get("type") == "cancel":
+                if question_id in cancels:
+                    cancels[question_id].set()
+                continue
+
+            question = (data.get("question") or "").strip()
+            if question_id is None or not question:
+                await outgoing.put({"id": question_id, "type": "error", "detail": "Both id and question are required"})
+            elif question_id in cancels:
+                await outgoing.put({"id": question_id, "type": "error", "detail": "A question with this id is in flight"})
+            elif len(cancels) >= WS_MAX_IN_FLIGHT:
+                await outgoing.put({"id": question_id, "type": "error", "detail": f"Too many questions in flight (max {WS_MAX_IN_FLIGHT})"})
+            elif not has_corpus(data.get("corpus")):
+                await outgoing.put({"id": question_id, "type": "error", "detail": f"Unknown corpus '{data.get('corpus')}'"})
+            else:
+                try:
+                    await scheduler.admit_async(identity)
+                except QuotaExceeded as e:
+                    await outgoing.put({"id": question_id, "type": "error", "detail": str(e), "retry_after": e.retry_after})
+                    continue
+                options = {key: data.get(key) for key in ("sources", "doc_type", "corpus")}
+                cancels[question_id] = threading.Event()
+                asyncio.ensure_future(answer(question_id, question, cancels[question_id], options))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Abandoned questions stop generating right away
+        for cancel in list(cancels.values()):
+            cancel.set()
+        sender.cancel()
+
+@app.post("/jobs", status_code=202)
+async def submit_job(job_request: JobRequest, identity: ClientIdentity = Depends(client_identity)):
+    """Queue a question and return its job id immediately (interactive clients' jobs run first)"""
+    question = job_request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    if has_corpus is not None and not has_corpus(job_request.corpus):
+        raise HTTPException(status_code=404, detail=f"Unknown corpus '{job_request.corpus}'")
+    await admit(identity)
+    
+    priority = max(-JOB_MAX_PRIORITY, min(JOB_MAX_PRIORITY, job_request.priority))
+    if identity.tier == INTERACTIVE:
+        priority += INTERACTIVE_JOB_PRIORITY
+    try:
+        job = job_manager.submit(
+            {
+                "question": question,
+                "sources": job_request.sources,
+                "doc_type": job_request.doc_type,
+                "session_id": job_request.session_id,
+                "corpus": job_request.corpus,
+                "client": identity.to_dict()
+            },
+            priority=priority,
+            client=identity.client_id,
+            weight=identity.weight
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    print(f"📥 Queued job {job.id} (client={identity.client_id}, priority={job.priority})")
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Poll a job's status (and result once finished)"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return render(request, job.to_dict())
+
+@app.get("/jobs/{job_id}/wait")
+async def wait_for_job(job_id: str, request: Request, timeout: float = Query(30.0, ge=0)):
+    """Long-poll until the job finishes or `timeout` seconds pass"""
+    job = await run_in_threadpool(job_manager.wait, job_id, min(timeout, JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return render(request, job.to_dict())
+
+@app.post("/admin/snapshot", dependencies=[Depends(require_admin)])
+async def create_snapshot():
+    """Save a warm-restart snapshot of the engine state now"""
+    if not rag_initialized:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    try:
+        from rag import save_engine_snapshot
+        path = await run_in_threadpool(save_engine_snapshot)
+    except Exception as e:
+        print(f"❌ Error saving snapshot: {e}")
+        raise HTTPException(status_code=500, detail=f"Snapshot failed: {str(e)}")
+    if path is None:
+        raise HTTPException(status_code=409, detail="Nothing to snapshot (partitions not loaded)")
+    return {"snapshot": path}
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def sample_profile(
+    seconds: float = Query(10.0, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5.0, ge=1, le=100)
+):
+    """
+    Sample every thread's stack for `seconds` and return collapsed stacks
+
+    The output can be fed straight to flamegraph.pl, speedscope or inferno.
+    """
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with profile_lock:
+        profiler = SamplingProfiler(interval=interval_ms / 1000)
+        print(f"🔬 Sampling profiler running for {seconds}s...")
+        collapsed = await run_in_threadpool(profiler.run, seconds)
+        print(f"✅ Profile captured ({profiler.samples} samples)")
+    return PlainTextResponse(collapsed)
+
+@app.get("/admin/clients", dependencies=[Depends(require_admin)])
+async def client_metrics():
+    """Per-client usage, throttling and queueing metrics"""
+    return scheduler.metrics()
+
+@app.get("/clients/me")
+async def my_usage(identity: ClientIdentity = Depends(client_identity)):
+    """The calling client's own usage and throttling metrics"""
+    usage = scheduler.metrics()["clients"].get(identity.client_id)
+    return {**identity.to_dict(), "usage": usage}
+
+@app.get("/corpora")
+async def get_corpora():
+    """List the available corpora, which ones are resident, and load/eviction metrics"""
+    if list_corpora is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    return list_corpora()
+
+@app.post("/admin/reload-index", dependencies=[Depends(require_admin)], status_code=202)
+async def reload_index_endpoint(reload_request: Optional[ReloadIndexRequest] = None):
+    """Build a new index version in the background, warm it and hot-swap it in"""
+    if not rag_initialized:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    from rag import reload_index
+    path = reload_request.path if reload_request else None
+    if path is not None and not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"ChromaDB directory '{path}' not found")
+    return reload_index(path)
+
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+async def index_status_endpoint():
+    """Show the active and draining index versions and the last reload"""
+    if not rag_initialized:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    from rag import index_status
+    return index_status()
+
+@app.get("/sources")
+async def get_sources(corpus: Optional[str] = None):
+    """List the documents that can be passed as `sources` / `doc_type` filters"""
+    if list_sources is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    if not has_corpus(corpus):
+        raise HTTPException(status_code=404, detail=f"Unknown corpus '{corpus}'")
+    return {"sources": await run_in_threadpool(list_sources, corpus)}
+
 # Alternative endpoint for backwards compatibility
 @app.post("/chat-legacy")
-async def chat_legacy(request: Request):
+async def chat_legacy(request: Request, identity: ClientIdentity = Depends(client_identity)):
     try:
         data = await request.json()
         question = data.get("question", "").strip()
@@ -135,12 +711,15 @@ async def chat_legacy(request: Request):
         if not question:
             return {"error": "Question cannot be empty"}
         
-        if rag_chat is None:
+        if plan_turn is None:
             return {"error": "RAG system not properly initialized"}
         
-        answer = rag_chat(question)
-        return {"answer": answer or "No response generated"}
+        await admit(identity)
+        result = await answer_turn(identity, question)
+        return {"answer": result["answer"] or "No response generated"}
     
+    except HTTPException:
+        raise  # quota errors keep their 429 status
     except Exception as e:
         print(f"❌ Error in legacy chat endpoint: {e}")
         return {"error": f"Error processing request: {str(e)}"}
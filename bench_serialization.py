@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark
+Measures the per-request cost of encoding (and compressing) typical /chat payloads
+"""
+
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+from serialization import brotli, msgpack, orjson
+
+SAMPLE_CHUNK = (
+    "Organizations deploying AI systems shall establish accountability mechanisms, "
+    "document data provenance and perform impact assessments before deployment. "
+) * 6
+
+def build_payload(num_sources: int) -> dict:
+    """Build a /chat response with sources, chunk text and timings"""
+    return {
+        "answer": "AI governance refers to the frameworks, policies and processes ... " * 20,
+        "sources": [
+            {
+                "source": f"AI_Policy_Document_{i}.pdf",
+                "doc_type": "pdf",
+                "score": 0.8123 - i * 0.01,
+                "metadata": {"source": f"docs/AI_Policy_Document_{i}.pdf", "page": i, "chunk": SAMPLE_CHUNK},
+            }
+            for i in range(num_sources)
+        ],
+        "timings": {"retrieval_ms": 12.4, "llm_ms": 1840.2, "total_ms": 1855.9},
+    }
+
+def time_call(func, iterations: int) -> float:
+    """Return the median wall time of func() in microseconds"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+def benchmark(num_sources: int, iterations: int) -> list:
+    payload = build_payload(num_sources)
+    encoders = {
+        "json (stdlib)": lambda: json.dumps(payload).encode("utf-8"),
+        "json (compact)": lambda: json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"),
+    }
+    if orjson is not None:
+        encoders["orjson"] = lambda: orjson.dumps(payload)
+    if msgpack is not None:
+        encoders["msgpack"] = lambda: msgpack.packb(payload, use_bin_type=True)
+
+    rows = []
+    for name, encode in encoders.items():
+        body = encode()
+        rows.append({"format": name, "bytes": len(body), "encode_us": time_call(encode, iterations)})
+
+    body = encoders.get("orjson", encoders["json (compact)"])()
+    compressors = {"gzip-6": lambda: gzip.compress(body, compresslevel=6)}
+    if brotli is not None:
+        compressors["brotli-4"] = lambda: brotli.compress(body, quality=4)
+    for name, compress in compressors.items():
+        rows.append({"format": f"json + {name}", "bytes": len(compress()), "encode_us": time_call(compress, iterations)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API payload serialization")
+    parser.add_argument("--sources", type=int, nargs="+", default=[0, 5, 20], help="Number of sources per payload")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("📊 Serialization cost per request")
+    print(f"   orjson: {'yes' if orjson else 'no'} | msgpack: {'yes' if msgpack else 'no'} | brotli: {'yes' if brotli else 'no'}")
+    for num_sources in args.sources:
+        print(f"\n🔍 Payload with {num_sources} sources")
+        print(f"{'format':<22}{'bytes':>10}{'median µs':>12}")
+        print("-" * 44)
+        for row in benchmark(num_sources, args.iterations):
+            print(f"{row['format']:<22}{row['bytes']:>10}{row['encode_us']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
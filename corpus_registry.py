@@ -0,0 +1,302 @@
+"""
+Registry of named corpora (one ChromaDB directory each).
+
+Corpora are opened lazily on first use and kept resident under an LRU policy
+with a total memory budget; the least recently used ones are released when a
+newly loaded corpus pushes the total over budget.
+"""
+
+import gc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from langchain_core.documents import Document
+
+from partitions import PartitionedIndex, chroma_filter, source_catalog
+
+
+def cosine_from_distance(distance: float, space: str = "l2") -> float:
+    """
+    Convert a Chroma distance to the cosine similarity PartitionedIndex reports
+
+    bge embeddings are unit length, so squared L2 distance is 2 - 2 * cosine. One
+    calibrated RAG_MIN_RELEVANCE / RAG_SCORE_GAP then applies to both search paths.
+    """
+    if space in ("cosine", "ip"):
+        return 1.0 - distance
+    return 1.0 - distance / 2.0
+
+
+def search_store(vectorstore, index, embedding_model, question: str, k: int, sources=None, doc_type=None):
+    """Search one vector store: the partitioned index when available, ChromaDB filters otherwise"""
+    query_embedding = embedding_model.embed_query(question)
+    if index is not None:
+        return index.search_by_vector(query_embedding, k=k, sources=sources, doc_type=doc_type)
+    return search_store_batch(vectorstore, None, [query_embedding], k, sources, doc_type)[0]
+
+
+def search_store_batch(vectorstore, index, query_embeddings, k: int, sources=None, doc_type=None):
+    """Search many already embedded queries against one vector store in a single pass"""
+    if index is not None:
+        return index.search_batch(query_embeddings, k=k, sources=sources, doc_type=doc_type)
+
+    stored_sources = source_catalog(vectorstore).resolve(sources, doc_type)
+    if stored_sources == []:
+        return [[] for _ in range(len(query_embeddings))]
+    query_kwargs = {"query_embeddings": query_embeddings, "n_results": k}
+    where = chroma_filter(stored_sources)
+    if where:
+        query_kwargs["where"] = where
+    results = vectorstore._collection.query(**query_kwargs)
+    space = (vectorstore._collection.metadata or {}).get("hnsw:space", "l2")
+
+    batch = []
+    for ids, documents, metadatas, distances in zip(
+        results["ids"], results["documents"], results["metadatas"], results["distances"]
+    ):
+        batch.append([
+            (Document(page_content=text, metadata={**(metadata or {}), "id": chunk_id}), cosine_from_distance(distance, space))
+            for chunk_id, text, metadata, distance in zip(ids, documents, metadatas, distances)
+        ])
+    return batch
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def discover_corpora(corpora_dir: Optional[str] = None, corpora_json: Optional[str] = None) -> Dict[str, str]:
+    """
+    Find the available corpora
+
+    Every subdirectory of `corpora_dir` is a corpus named after the directory;
+    `corpora_json` ({"name": "path"}) adds or overrides entries.
+    """
+    corpora = {}
+    if corpora_dir and os.path.isdir(corpora_dir):
+        for name in sorted(os.listdir(corpora_dir)):
+            path = os.path.join(corpora_dir, name)
+            if os.path.isdir(path):
+                corpora[name] = path
+    if corpora_json:
+        corpora.update(json.loads(corpora_json))
+    return corpora
+
+
+class Corpus:
+    """An opened corpus: its vector store, partitioned index and memory footprint"""
+
+    def __init__(self, name: str, path: str, vectorstore, index):
+        self.name = name
+        self.path = path
+        self.vectorstore = vectorstore
+        self.index = index
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+        self.active_searches = 0
+        self.evicted = False
+        # Chroma keeps the collection's HNSW index resident as well, partitions or not
+        self.nbytes = directory_size(path)
+        if index is not None:
+            self.nbytes += index.nbytes + sum(len(text) for text in index.documents)
+
+
+def _shared_systems() -> dict:
+    """chromadb's process-wide cache of client systems (identifier -> System)"""
+    try:
+        from chromadb.api.client import SharedSystemClient
+    except ImportError:
+        return {}
+    return getattr(SharedSystemClient, "_identifer_to_system", {})
+
+
+def forget_chroma_path(path: str):
+    """
+    Drop chromadb's cached client system for a persist directory
+
+    chromadb hands every client on a directory the same cached system, with the
+    HNSW and sysdb state it loaded. After this, the next store opened on the path
+    gets a fresh system; stores still using the old one keep it until closed.
+    """
+    target = os.path.abspath(path)
+    cache = _shared_systems()
+    for identifier, system in list(cache.items()):
+        persist = getattr(getattr(system, "settings", None), "persist_directory", None) or identifier
+        if persist and os.path.abspath(str(persist)) == target:
+            del cache[identifier]
+
+
+def open_vectorstore(path: str, embedding_model):
+    """Open a Chroma vector store on a client system of its own, so closing it affects no other store"""
+    from langchain.vectorstores import Chroma
+
+    forget_chroma_path(path)
+    return Chroma(persist_directory=path, embedding_function=embedding_model)
+
+
+def close_vectorstore(vectorstore):
+    """
+    Stop the Chroma client behind a vector store, releasing its HNSW indexes and connections
+
+    The system is dropped from chromadb's cache first, so that reopening the
+    directory later starts a fresh system.
+    """
+    system = getattr(getattr(vectorstore, "_client", None), "_system", None)
+    if system is None:
+        return
+    cache = _shared_systems()
+    for identifier, cached in list(cache.items()):
+        if cached is system:
+            del cache[identifier]
+    try:
+        system.stop()
+    except Exception as e:
+        print(f"⚠️  Could not stop Chroma client: {e}")
+
+
+class CorpusRegistry:
+    """Lazily loaded, LRU-evicted collection of named corpora under a memory budget"""
+
+    def __init__(self, corpora: Dict[str, str], embedding_model, memory_budget_bytes: int):
+        self.corpora = dict(corpora)
+        self.embedding_model = embedding_model
+        self.memory_budget_bytes = memory_budget_bytes
+        self._resident = OrderedDict()  # name -> Corpus, least recently used first
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.corpora}
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+        self.load_seconds = 0.0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.corpora
+
+    def get(self, name: str) -> Corpus:
+        """Return an opened corpus, loading it (and evicting others) if needed"""
+        if name not in self.corpora:
+            raise KeyError(f"Unknown corpus '{name}'")
+
+        corpus = self._touch(name)
+        if corpus is not None:
+            return corpus
+
+        # One loader per corpus; concurrent requests for the same corpus wait for it
+        with self._load_locks[name]:
+            corpus = self._touch(name)
+            if corpus is not None:
+                return corpus
+            corpus = self._load(name)
+            with self._lock:
+                self._resident[name] = corpus
+                self._evict(keep=name)
+            return corpus
+
+    @contextmanager
+    def acquire(self, name: str):
+        """Pin a corpus for the duration of a search so eviction cannot close it underneath"""
+        while True:
+            corpus = self.get(name)
+            with self._lock:
+                if not corpus.evicted:
+                    corpus.active_searches += 1
+                    break
+        try:
+            yield corpus
+        finally:
+            with self._lock:
+                corpus.active_searches -= 1
+                if corpus.evicted and corpus.active_searches == 0:
+                    self._close(corpus)
+
+    def search(self, name: str, question: str, k: int, sources=None, doc_type=None):
+        with self.acquire(name) as corpus:
+            return search_store(corpus.vectorstore, corpus.index, self.embedding_model, question, k, sources, doc_type)
+
+    def search_batch(self, name: str, query_embeddings, k: int, sources=None, doc_type=None):
+        with self.acquire(name) as corpus:
+            return search_store_batch(corpus.vectorstore, corpus.index, query_embeddings, k, sources, doc_type)
+
+    def _touch(self, name: str) -> Optional[Corpus]:
+        with self._lock:
+            corpus = self._resident.get(name)
+            if corpus is not None:
+                self._resident.move_to_end(name)
+                corpus.last_used = time.time()
+                corpus.hits += 1
+                self.hits += 1
+            return corpus
+
+    def _load(self, name: str) -> Corpus:
+        path = self.corpora[name]
+        print(f"🔄 Loading corpus '{name}' from {path}...")
+        start = time.perf_counter()
+        vectorstore = open_vectorstore(path, self.embedding_model)
+        try:
+            index = PartitionedIndex.from_vectorstore(vectorstore)
+        except Exception as e:
+            print(f"⚠️  Could not partition corpus '{name}', using ChromaDB filters instead: {e}")
+            index = None
+        corpus = Corpus(name, path, vectorstore, index)
+
+        elapsed = time.perf_counter() - start
+        self.loads += 1
+        self.load_seconds += elapsed
+        print(f"✅ Corpus '{name}' loaded ({corpus.nbytes / 1e6:.1f} MB, {elapsed:.2f}s)")
+        return corpus
+
+    def _evict(self, keep: str):
+        """Release least recently used corpora until the budget is met (lock must be held)"""
+        evicted = False
+        while self.resident_bytes > self.memory_budget_bytes and len(self._resident) > 1:
+            name, corpus = next(iter(self._resident.items()))
+            if name == keep:
+                break
+            # In-flight searches keep the corpus open; the last one to finish closes it
+            del self._resident[name]
+            corpus.evicted = True
+            if corpus.active_searches == 0:
+                self._close(corpus)
+            self.evictions += 1
+            evicted = True
+            print(f"♻️  Evicted corpus '{name}' ({corpus.nbytes / 1e6:.1f} MB)")
+        if evicted:
+            gc.collect()
+
+    def _close(self, corpus: Corpus):
+        """Release an evicted corpus's Chroma client and index (lock must be held)"""
+        close_vectorstore(corpus.vectorstore)
+        corpus.vectorstore = None
+        corpus.index = None
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(corpus.nbytes for corpus in self._resident.values())
+
+    def metrics(self) -> dict:
+        with self._lock:
+            resident = [
+                {"name": c.name, "bytes": c.nbytes, "hits": c.hits, "loaded_at": c.loaded_at, "last_used": c.last_used}
+                for c in self._resident.values()
+            ]
+            resident_bytes = self.resident_bytes
+        return {
+            "available": sorted(self.corpora),
+            "resident": resident,
+            "resident_bytes": resident_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "load_seconds": round(self.load_seconds, 3),
+        }
@@ -0,0 +1,260 @@
+"""
+Single entry point for starting the RAG engine with a deployment profile.
+
+`RAG_PROFILE` picks a performance envelope:
+
+- standard:         Together AI LLM, default sizes (the historical behaviour)
+- low-memory:       Together AI LLM, no in-RAM index copy, small caches and pools
+- offline-cpu:      local chat model on the CPU, no network access at runtime
+- high-throughput:  Together AI LLM, large batches, caches and worker pools
+
+Any single setting can still be overridden with its environment variable
+(see SETTING_ENV). The pipeline itself lives in rag.py; this module only
+decides which components load and how they are sized, then times the startup.
+"""
+
+import os
+import sys
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CPU_COUNT = os.cpu_count() or 1
+DEFAULT_PROFILE = "standard"
+
+PROFILES = {
+    "standard": {
+        "description": "Together AI LLM with default sizes",
+        "llm": "together",
+        "offline": False,
+        "build_partitions": True,
+        "torch_threads": 0,  # 0 keeps the torch default
+        "embed_batch_size": 32,
+        "corpus_memory_mb": 1024,
+        "rewrite_cache_size": 1024,
+        "state_max_keys": 100000,
+        "warmup_queries": 32,
+        "index_watch_interval": 0.0,
+        "llm_slots": 8,
+        "job_workers": 2,
+        "batch_max_concurrency": 8,
+        "ws_max_in_flight": 8,
+    },
+    "low-memory": {
+        "description": "Low-memory remote LLM: no in-RAM index copy, small caches and pools",
+        "llm": "together",
+        "offline": False,
+        "build_partitions": False,  # snapshots are still memory-mapped
+        "torch_threads": 1,
+        "embed_batch_size": 8,
+        "corpus_memory_mb": 128,
+        "rewrite_cache_size": 256,
+        "state_max_keys": 10000,
+        "warmup_queries": 8,
+        "index_watch_interval": 0.0,
+        "llm_slots": 4,
+        "job_workers": 1,
+        "batch_max_concurrency": 4,
+        "ws_max_in_flight": 4,
+    },
+    "offline-cpu": {
+        "description": "Offline local CPU: small chat model on the CPU, no network access at runtime",
+        "llm": "local",
+        "offline": True,
+        "build_partitions": True,
+        "torch_threads": CPU_COUNT,
+        "embed_batch_size": 16,
+        "corpus_memory_mb": 512,
+        "rewrite_cache_size": 1024,
+        "state_max_keys": 100000,
+        "warmup_queries": 16,
+        "index_watch_interval": 0.0,
+        "llm_slots": 1,
+        "job_workers": 1,  # one generation at a time saturates the CPU
+        "batch_max_concurrency": 1,
+        "ws_max_in_flight": 2,
+    },
+    "high-throughput": {
+        "description": "High-throughput: large batches, caches and worker pools",
+        "llm": "together",
+        "offline": False,
+        "build_partitions": True,
+        "torch_threads": CPU_COUNT,
+        "embed_batch_size": 128,
+        "corpus_memory_mb": 4096,
+        "rewrite_cache_size": 8192,
+        "state_max_keys": 1000000,
+        "warmup_queries": 128,
+        "index_watch_interval": 30.0,
+        "llm_slots": 32,
+        "job_workers": 8,
+        "batch_max_concurrency": 32,
+        "ws_max_in_flight": 32,
+    },
+}
+
+# Environment variables that override a profile setting
+SETTING_ENV = {
+    "llm": "RAG_LLM",
+    "offline": "RAG_OFFLINE",
+    "build_partitions": "RAG_BUILD_PARTITIONS",
+    "torch_threads": "RAG_TORCH_THREADS",
+    "embed_batch_size": "RAG_EMBED_BATCH_SIZE",
+    "corpus_memory_mb": "RAG_CORPUS_MEMORY_MB",
+    "rewrite_cache_size": "RAG_REWRITE_CACHE_SIZE",
+    "state_max_keys": "RAG_STATE_MAX_KEYS",
+    "warmup_queries": "RAG_WARMUP_QUERIES",
+    "index_watch_interval": "RAG_INDEX_WATCH_INTERVAL",
+    "llm_slots": "RAG_LLM_SLOTS",
+    "job_workers": "JOB_WORKERS",
+    "batch_max_concurrency": "BATCH_MAX_CONCURRENCY",
+    "ws_max_in_flight": "WS_MAX_IN_FLIGHT",
+}
+
+startup_report = None
+
+
+def profile_name() -> str:
+    return os.getenv("RAG_PROFILE", DEFAULT_PROFILE)
+
+
+def _coerce(value: str, default):
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    return type(default)(value)
+
+
+def settings(profile=None) -> dict:
+    """Resolve a profile's settings, applying environment overrides"""
+    name = profile or profile_name()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown RAG_PROFILE '{name}' (choose from {', '.join(PROFILES)})")
+    resolved = {}
+    for key, default in PROFILES[name].items():
+        value = os.getenv(SETTING_ENV[key]) if key in SETTING_ENV else None
+        resolved[key] = default if value is None else _coerce(value, default)
+    return resolved
+
+
+def offline_mode(profile=None) -> bool:
+    """
+    Whether a profile forbids network access, setting the Hugging Face offline flags if so
+
+    huggingface_hub and transformers read these flags when they are imported, so this
+    also runs when this module is imported (api.py and rag.py import it first).
+    """
+    global OFFLINE
+    name = profile or profile_name()
+    if name not in PROFILES or not settings(name)["offline"]:
+        return False
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    OFFLINE = True
+    return True
+
+
+OFFLINE = False
+offline_mode()
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def start_engine(profile=None) -> dict:
+    """
+    Load the components selected by a profile and measure startup
+
+    Returns:
+        dict: profile name, resolved settings, per-stage and total startup seconds, RSS in MB
+    """
+    global startup_report
+    name = profile or profile_name()
+    config = settings(name)
+    print(f"⚙️  Engine profile: {name} ({config['description']})")
+
+    if config["offline"]:
+        late = not OFFLINE and any(module in sys.modules for module in ("huggingface_hub", "transformers"))
+        offline_mode(name)
+        if late:
+            # Already imported libraries keep their flags: set RAG_PROFILE in the environment instead
+            print(f"⚠️  Profile '{name}' selected after Hugging Face was imported; it may still use the network")
+
+    start = time.perf_counter()
+    rss_before = rss_mb()
+    import rag
+
+    # Size the pipeline before anything is loaded
+    if config["torch_threads"] > 0:
+        rag.torch.set_num_threads(config["torch_threads"])
+    rag.BUILD_PARTITIONS = config["build_partitions"]
+    rag.EMBED_BATCH_SIZE = config["embed_batch_size"]
+    rag.CORPUS_MEMORY_BUDGET_MB = config["corpus_memory_mb"]
+    rag.REWRITE_CACHE_SIZE = config["rewrite_cache_size"]
+    rag.STATE_MAX_KEYS = config["state_max_keys"]
+    rag.recent_queries = deque(rag.recent_queries, maxlen=config["warmup_queries"])
+
+    stages = [
+        ("state_store", rag.initialize_state_store),
+        ("embeddings", rag.initialize_embeddings),
+        ("vectorstore", rag.initialize_vectorstore),
+        ("corpus_registry", rag.initialize_corpus_registry),
+        ("llm", rag.initialize_local_llm if config["llm"] == "local" else rag.initialize_llm),
+        ("query_rewriter", rag.initialize_query_rewriter),
+        ("chain", rag.create_rag_chain),
+        ("index_watcher", lambda: rag.start_index_watcher(config["index_watch_interval"])),
+    ]
+    timings = {"imports": round(time.perf_counter() - start, 3)}
+    for stage, initialize in stages:
+        stage_start = time.perf_counter()
+        initialize()
+        timings[stage] = round(time.perf_counter() - stage_start, 3)
+
+    startup_report = {
+        "profile": name,
+        "settings": config,
+        "startup_seconds": round(time.perf_counter() - start, 3),
+        "stage_seconds": timings,
+        "rss_before_mb": round(rss_before, 1),
+        "rss_after_startup_mb": round(rss_mb(), 1),
+    }
+    print(f"📊 Profile '{name}' started in {startup_report['startup_seconds']:.2f}s, "
+          f"RSS {startup_report['rss_after_startup_mb']:.0f} MB")
+    return startup_report
+
+
+def engine_report() -> dict:
+    """Startup measurements plus the current memory usage"""
+    report = dict(startup_report) if startup_report else {"profile": profile_name(), "started": False}
+    report["rss_mb"] = round(rss_mb(), 1)
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Start the engine with a profile and print its startup report")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=None)
+    args = parser.parse_args()
+    start_engine(args.profile)
+    print(json.dumps(engine_report(), indent=2))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Retrieval Evaluation Harness
+Sweeps k, index settings and embedders over a labeled question set and reports
+recall@k, MRR and per-query latency percentiles.
+With --off-topic it also calibrates the RAG_MIN_RELEVANCE "I don't know" threshold.
+
+Labeled set format (JSON list or JSONL), relevant items are chunk ids or source filenames:
+    {"question": "What is AI governance?", "relevant": ["AI_Principles.pdf"]}
+
+Example:
+    python evaluate_retrieval.py labeled.jsonl --k 1 3 5 10 --backends partitioned chroma \\
+        --search-ef 10 50 100 --embedders BAAI/bge-base-en-v1.5 BAAI/bge-small-en-v1.5 --output sweep.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from corpus_registry import search_store_batch
+from partitions import PartitionedIndex, source_name
+
+def load_labeled_set(path: str) -> list:
+    """Load labeled questions from a JSON list or a JSONL file"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for item in items:
+        if not item.get("question") or not item.get("relevant"):
+            raise ValueError(f"Each item needs 'question' and 'relevant': {item}")
+    return items
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+def evaluate(search, labeled: list, ks: list) -> dict:
+    """
+    Run every labeled question through `search(question, k)` and score the results
+
+    Returns:
+        dict: recall@k for each k, MRR, latency percentiles (ms) and the best score of every query
+    """
+    max_k = max(ks)
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks = []
+    latencies = []
+    best_scores = []
+
+    for item in labeled:
+        relevant = set(item["relevant"])
+        start = time.perf_counter()
+        results = search(item["question"], max_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        docs = [doc for doc, _ in results]
+        best_scores.append(max((score for _, score in results), default=0.0))
+
+        # Source-level labels may match several chunks: count each relevant item once
+        found_at = {}
+        for rank, doc in enumerate(docs, start=1):
+            for key in (doc.metadata.get("id") or getattr(doc, "id", None), source_name(doc.metadata)):
+                if key in relevant and key not in found_at:
+                    found_at[key] = rank
+
+        for k in ks:
+            recalls[k].append(sum(1 for rank in found_at.values() if rank <= k) / len(relevant))
+        first = min(found_at.values()) if found_at else None
+        reciprocal_ranks.append(1.0 / first if first else 0.0)
+
+    return {
+        "recall": {f"@{k}": round(statistics.mean(recalls[k]), 4) for k in ks},
+        "mrr": round(statistics.mean(reciprocal_ranks), 4),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(statistics.mean(latencies), 2),
+        },
+        "queries": len(labeled),
+        "best_scores": best_scores,
+    }
+
+def calibrate_threshold(in_topic: list, off_topic: list) -> dict:
+    """
+    Pick the best-score threshold that best separates answerable from off-topic questions
+
+    Maximizes balanced accuracy: in-topic questions should score at or above the
+    threshold, off-topic questions below it.
+    """
+    candidates = sorted(set(in_topic) | set(off_topic))
+    best = {"threshold": 0.0, "balanced_accuracy": 0.0}
+    for threshold in candidates:
+        kept = sum(1 for score in in_topic if score >= threshold) / len(in_topic)
+        rejected = sum(1 for score in off_topic if score < threshold) / len(off_topic)
+        accuracy = (kept + rejected) / 2
+        if accuracy > best["balanced_accuracy"]:
+            best = {
+                "threshold": round(threshold, 4),
+                "balanced_accuracy": round(accuracy, 4),
+                "in_topic_kept": round(kept, 4),
+                "off_topic_rejected": round(rejected, 4),
+            }
+    return best
+
+def load_questions(path: str) -> list:
+    """Load off-topic questions (one per line, or JSON/JSONL items with a 'question' field)"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return [item["question"] if isinstance(item, dict) else item for item in json.loads(text)]
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            questions.append(json.loads(line)["question"] if line.startswith("{") else line)
+    return questions
+
+def partitioned_search(index: PartitionedIndex, embedder):
+    def search(question, k):
+        return index.search_by_vector(embedder.embed_query(question), k=k)
+    return search
+
+def chroma_search(vectorstore, embedder):
+    # Same query path as serving without partitions (results carry chunk ids)
+    def search(question, k):
+        return search_store_batch(vectorstore, None, [embedder.embed_query(question)], k)[0]
+    return search
+
+def set_search_ef(vectorstore, search_ef: int) -> bool:
+    """Try to change the HNSW search_ef of the collection (not supported by every chromadb version)"""
+    collection = vectorstore._collection
+    try:
+        metadata = dict(collection.metadata or {})
+        metadata["hnsw:search_ef"] = search_ef
+        collection.modify(metadata=metadata)
+        return True
+    except Exception as e:
+        print(f"⚠️  Could not set hnsw:search_ef={search_ef}: {e}")
+        return False
+
+def build_configs(args, vectorstore, default_embedder, chroma_path: str):
+    """Yield (config, search function) for every retriever configuration in the sweep"""
+    from langchain.embeddings import HuggingFaceEmbeddings
+    from langchain.vectorstores import Chroma
+
+    stored = None
+    scratch_dir = None
+    try:
+        for model_name in args.embedders:
+            if model_name == args.default_embedder:
+                embedder = default_embedder
+            else:
+                print(f"🔄 Loading alternative embedder {model_name}...")
+                embedder = HuggingFaceEmbeddings(model_name=model_name)
+
+            if "partitioned" in args.backends:
+                if model_name == args.default_embedder:
+                    index = PartitionedIndex.from_vectorstore(vectorstore)
+                else:
+                    # The stored vectors belong to the default embedder: re-embed the corpus
+                    if stored is None:
+                        stored = vectorstore.get(include=["documents", "metadatas"])
+                    print(f"🔄 Re-embedding {len(stored['ids'])} chunks with {model_name}...")
+                    embeddings = embedder.embed_documents(stored["documents"])
+                    index = PartitionedIndex(stored["ids"], embeddings, stored["documents"], stored["metadatas"])
+                yield {"backend": "partitioned", "embedder": model_name}, partitioned_search(index, embedder)
+
+            if "chroma" in args.backends and model_name == args.default_embedder:
+                for search_ef in args.search_ef or [None]:
+                    store = vectorstore
+                    if search_ef is not None:
+                        # Sweep search_ef on a scratch copy: the serving collection and its fingerprint stay untouched
+                        if scratch_dir is None:
+                            scratch_dir = tempfile.mkdtemp(prefix="chroma_sweep_")
+                            shutil.copytree(chroma_path, scratch_dir, dirs_exist_ok=True)
+                            print(f"📁 Sweeping search_ef on a copy of {chroma_path} ({scratch_dir})")
+                        store = Chroma(persist_directory=scratch_dir, embedding_function=embedder)
+                        if not set_search_ef(store, search_ef):
+                            continue
+                    yield {"backend": "chroma", "embedder": model_name, "search_ef": search_ef}, chroma_search(store, embedder)
+    finally:
+        if scratch_dir is not None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def print_table(results: list, ks: list):
+    recall_columns = [f"R@{k}" for k in ks]
+    header = f"{'backend':<12}{'embedder':<28}{'ef':>6}" + "".join(f"{c:>8}" for c in recall_columns)
+    header += f"{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        config, metrics = row["config"], row["metrics"]
+        line = f"{config['backend']:<12}{config['embedder'][-27:]:<28}{str(config.get('search_ef') or '-'):>6}"
+        line += "".join(f"{metrics['recall'][f'@{k}']:>8.3f}" for k in ks)
+        latency = metrics["latency_ms"]
+        line += f"{metrics['mrr']:>8.3f}{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}"
+        print(line)
+
+    for row in results:
+        if "calibration" in row["metrics"]:
+            calibration = row["metrics"]["calibration"]
+            print(f"🎯 {row['config']}: suggested RAG_MIN_RELEVANCE={calibration['threshold']} "
+                  f"(balanced accuracy {calibration['balanced_accuracy']:.3f})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retrieval settings against a labeled question set")
+    parser.add_argument("labeled", help="JSON/JSONL file with question -> relevant chunk ids or filenames")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10], help="k values to report recall for")
+    parser.add_argument("--backends", nargs="+", default=["partitioned", "chroma"], choices=["partitioned", "chroma"])
+    parser.add_argument("--search-ef", type=int, nargs="*", default=[], help="HNSW search_ef values (chroma backend)")
+    parser.add_argument("--default-embedder", default="BAAI/bge-base-en-v1.5", help="Embedder the chroma_db was built with")
+    parser.add_argument("--embedders", nargs="+", default=None, help="Embedder variants to compare")
+    parser.add_argument("--off-topic", default=None, help="Questions the corpus cannot answer, to calibrate RAG_MIN_RELEVANCE")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    args.embedders = args.embedders or [args.default_embedder]
+    ks = sorted(set(args.k))
+
+    labeled = load_labeled_set(args.labeled)
+    print(f"📋 Loaded {len(labeled)} labeled questions from {args.labeled}")
+    off_topic = load_questions(args.off_topic) if args.off_topic else []
+
+    import rag
+    rag.initialize_embeddings()
+    vectorstore, _ = rag.initialize_vectorstore()
+
+    results = []
+    for config, search in build_configs(args, vectorstore, rag.embedding_model, rag.index_handle.current.path):
+        print(f"🔍 Evaluating {config}...")
+        search("warm up", max(ks))
+        metrics = evaluate(search, labeled, ks)
+        if off_topic:
+            off_scores = [max((score for _, score in search(q, 1)), default=0.0) for q in off_topic]
+            metrics["calibration"] = calibrate_threshold(metrics["best_scores"], off_scores)
+        results.append({"config": config, "metrics": metrics})
+
+    print()
+    print_table(results, ks)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"labeled_set": os.path.abspath(args.labeled), "k": ks, "results": results}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return results
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
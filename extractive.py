@@ -0,0 +1,154 @@
+"""
+Extractive fast path for definition and lookup questions.
+
+"What is X?" and "Which document defines Y?" are usually answered by one
+sentence that is already in a retrieved chunk. Such questions are detected
+with a few patterns, the sentences of the top chunks are scored for a
+definition of the term, and the best sentence is returned with its source
+filename. When no sentence is convincing enough the caller falls back to
+the LLM.
+"""
+
+import re
+from typing import List, Optional
+
+from partitions import source_name
+
+DEFINITION_PATTERNS = [
+    re.compile(r"^(?:what|who)\s+(?:is|are|was|were)\s+(?:meant\s+by\s+)?(?P<term>.+?)\??$", re.IGNORECASE),
+    re.compile(r"^what\s+(?:does|do)\s+(?P<term>.+?)\s+(?:mean|stand\s+for|refer\s+to)\??$", re.IGNORECASE),
+    re.compile(r"^what\s+is\s+the\s+(?:definition|meaning)\s+of\s+(?P<term>.+?)\??$", re.IGNORECASE),
+    re.compile(r"^(?:define|definition\s+of)\s+(?P<term>.+?)[.?]?$", re.IGNORECASE),
+]
+
+LOOKUP_PATTERNS = [
+    re.compile(r"^(?:which|what)\s+(?:document|file|policy|source)s?\s+(?:defines?|describes?|covers?|mentions?)\s+(?P<term>.+?)\??$", re.IGNORECASE),
+    re.compile(r"^where\s+(?:is|are)\s+(?P<term>.+?)\s+(?:defined|described|covered)\??$", re.IGNORECASE),
+]
+
+# Questions asking for reasoning, comparisons or lists need the LLM
+COMPLEX_MARKERS = re.compile(r"\b(and|versus|vs\.?|compare|difference|differ|why|how|steps|list|examples?)\b", re.IGNORECASE)
+
+STOPWORDS = {"a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "by", "with", "s"}
+
+# Definition questions need the term as the subject of the sentence ("X is/means ...")
+STRONG_CUE = 0.9
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])|\n{2,}|\n(?=[-*•]\s)")
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+def classify_question(question: str):
+    """
+    Detect cheap question types
+
+    Returns:
+        tuple: ("definition" | "lookup", term), or None when the question needs the LLM
+    """
+    question = " ".join(question.strip().split())
+    for kind, patterns in (("lookup", LOOKUP_PATTERNS), ("definition", DEFINITION_PATTERNS)):
+        for pattern in patterns:
+            match = pattern.match(question)
+            if not match:
+                continue
+            term = match.group("term").strip(" \"'")
+            if not term or len(term.split()) > 8 or COMPLEX_MARKERS.search(term):
+                return None
+            return kind, term
+    return None
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for part in SENTENCE_SPLIT.split(text):
+        part = " ".join(part.split()).lstrip("-*• ")
+        if part:
+            sentences.append(part)
+    return sentences
+
+
+def definition_cue(sentence: str, term: str) -> float:
+    """How strongly a sentence reads as a definition of `term` (0..1)"""
+    escaped = re.escape(term)
+    # "X is", "X (Y) is" and the acronym form "Full Name (X) is"
+    lead = rf"(?:\b|^){escaped}\)?(?:\s*\([^)]{{1,40}}\))?,?\s+"
+    if re.search(lead + r"(?:is|are)\s+(?:defined\s+as|understood\s+as)\b", sentence, re.IGNORECASE):
+        return 1.0
+    if re.search(lead + r"(?:refers?\s+to|means|denotes|is|are)\b", sentence, re.IGNORECASE):
+        return 0.9
+    if re.search(rf"\b(?:defined\s+as|definition\s+of)\b.*{escaped}|{escaped}.*\b(?:defined\s+as|refers?\s+to|means)\b",
+                 sentence, re.IGNORECASE):
+        return 0.6
+    return 0.0
+
+
+class ExtractiveAnswerer:
+    """Answer definition/lookup questions with a sentence from the retrieved chunks"""
+
+    def __init__(self, min_confidence: float = 0.6, max_chunks: int = 3, max_words: int = 80):
+        self.min_confidence = min_confidence
+        self.max_chunks = max_chunks
+        self.max_words = max_words
+        self.answered = 0
+        self.fallbacks = 0
+
+    def best_sentence(self, term: str, docs_with_scores, min_cue: float = 0.0):
+        """Return (confidence, sentence, Document, retrieval score) for the best definition, or None"""
+        term_tokens = set(_tokens(term))
+        if not term_tokens:
+            return None
+        best = None
+        for doc, score in docs_with_scores[:self.max_chunks]:
+            for sentence in split_sentences(doc.page_content):
+                words = len(sentence.split())
+                if words < 5 or words > self.max_words:
+                    continue
+                coverage = len(term_tokens & set(_tokens(sentence))) / len(term_tokens)
+                if coverage < 1.0:
+                    continue
+                cue = definition_cue(sentence, term)
+                if cue == 0.0 or cue < min_cue:
+                    continue
+                # The cue caps the confidence; retrieval score only scales it, so it cannot lift a weak cue
+                confidence = cue * (0.6 + 0.4 * max(0.0, min(1.0, float(score))))
+                if sentence.lower().find(term.lower()) > 40:
+                    confidence -= 0.1  # the term is not the subject of the sentence
+                if best is None or confidence > best[0]:
+                    best = (confidence, sentence, doc, score)
+        return best
+
+    def answer(self, question: str, docs_with_scores) -> Optional[dict]:
+        """
+        Answer directly from the chunks when confident
+
+        Returns:
+            dict: {"answer", "confidence", "chunk": the (Document, score) it came from}, or None to use the LLM
+        """
+        classified = classify_question(question)
+        if classified is None:
+            return None
+        kind, term = classified
+
+        best = self.best_sentence(term, docs_with_scores, STRONG_CUE if kind == "definition" else 0.0)
+        if best is None or best[0] < self.min_confidence:
+            self.fallbacks += 1
+            return None
+
+        confidence, sentence, doc, score = best
+        source = source_name(doc.metadata)
+        if kind == "lookup":
+            text = f"{term} is defined in {source}: \"{sentence}\""
+        else:
+            text = sentence
+        self.answered += 1
+        return {
+            "answer": f"{text}\n\nSources:\n- {source}",
+            "confidence": round(confidence, 3),
+            "chunk": (doc, score),
+        }
+
+    def stats(self) -> dict:
+        return {"answered": self.answered, "fallbacks": self.fallbacks, "min_confidence": self.min_confidence}
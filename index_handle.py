@@ -0,0 +1,115 @@
+"""
+Versioned handle on the active vector index.
+
+A new index version is built and warmed on the side, then swapped in
+atomically. Requests pin the version they started with, so in-flight
+requests finish on the old version, which is released (and its vector store
+closed) once it has drained.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class IndexVersion:
+    """One loaded version of the index (vector store + partitioned index)"""
+
+    def __init__(self, version: int, path: str, vectorstore, index, fingerprint: Optional[str] = None):
+        self.version = version
+        self.path = path
+        self.vectorstore = vectorstore
+        self.index = index
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        self.active_requests = 0
+        self.retired = False
+        self.drained = threading.Event()
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "fingerprint": self.fingerprint,
+            "chunks": len(self.index) if self.index is not None else None,
+            "loaded_at": self.loaded_at,
+            "active_requests": self.active_requests,
+        }
+
+
+class IndexHandle:
+    """Atomically swappable, reference-counted pointer to the current IndexVersion"""
+
+    def __init__(self, close: Optional[Callable] = None):
+        self.close = close  # called with a released version's vector store
+        self._current = None
+        self._draining = []
+        self._lock = threading.Lock()
+        self.swaps = 0
+
+    @property
+    def current(self) -> Optional[IndexVersion]:
+        return self._current
+
+    @contextmanager
+    def acquire(self):
+        """Pin the current version for the duration of a request"""
+        with self._lock:
+            version = self._current
+            if version is None:
+                raise RuntimeError("No index loaded")
+            version.active_requests += 1
+        try:
+            yield version
+        finally:
+            released = None
+            with self._lock:
+                version.active_requests -= 1
+                if version.retired and version.active_requests == 0:
+                    released = self._release(version)
+            self._close(released)
+
+    def install(self, version: IndexVersion) -> Optional[IndexVersion]:
+        """Make `version` current; the previous version is retired and released once drained"""
+        released = None
+        with self._lock:
+            previous = self._current
+            self._current = version
+            self.swaps += 1
+            if previous is not None:
+                previous.retired = True
+                if previous.active_requests == 0:
+                    released = self._release(previous)
+                else:
+                    self._draining.append(previous)
+        self._close(released)
+        return previous
+
+    def _release(self, version: IndexVersion):
+        """Drop the version's references (lock must be held); returns its vector store for _close"""
+        vectorstore = version.vectorstore
+        version.vectorstore = None
+        version.index = None
+        version.drained.set()
+        if version in self._draining:
+            self._draining.remove(version)
+        print(f"♻️  Released index version {version.version}")
+        return vectorstore
+
+    def _close(self, vectorstore):
+        """Close a released version's vector store (outside the lock: stopping a client can be slow)"""
+        if vectorstore is None or self.close is None:
+            return
+        try:
+            self.close(vectorstore)
+        except Exception as e:
+            print(f"⚠️  Could not close released index: {e}")
+
+    def describe(self) -> dict:
+        with self._lock:
+            return {
+                "current": self._current.describe() if self._current else None,
+                "draining": [v.describe() for v in self._draining],
+                "swaps": self.swaps,
+            }
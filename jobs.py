@@ -0,0 +1,238 @@
+"""
+Asynchronous job queue for long-running questions.
+
+Jobs are submitted with a priority, processed by a pool of worker threads and
+their results are kept in a bounded store that expires old entries. Within a
+priority level, jobs of different clients are interleaved (weighted fair
+queueing), so one client's backlog does not delay everybody else's jobs.
+A handler that cannot run a job yet (e.g. its client is over quota) raises
+RetryLater: the job goes back to the queue instead of blocking a worker.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds the maximum number of pending jobs"""
+
+
+class RetryLater(Exception):
+    """Raised by a handler to put its job back in the queue for `delay` seconds"""
+
+    def __init__(self, delay: float, reason: str = ""):
+        super().__init__(reason or f"retry in {delay:.1f}s")
+        self.delay = delay
+
+
+class Job:
+    """A single submitted question and its result"""
+
+    def __init__(self, payload: dict, priority: int = 0, client: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.priority = priority
+        self.client = client
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == SUCCEEDED:
+            data["result"] = self.result
+        elif self.status == FAILED:
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    """Priority job queue with a worker pool and a bounded, expiring result store"""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], dict],
+        workers: int = 2,
+        max_pending: int = 10000,
+        max_results: int = 1000,
+        result_ttl: float = 3600.0,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_results = max_results
+        self.result_ttl = result_ttl
+
+        self._jobs = OrderedDict()  # job_id -> Job, oldest first
+        self._heap = []  # (-priority, fair-queue finish tag, sequence, job_id)
+        self._deferred = []  # (not-before time, heap entry) of jobs waiting to be retried
+        self._virtual_time = {}  # priority -> finish tag of the last dequeued job
+        self._last_finish = {}  # (priority, client) -> finish tag of the client's latest job
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._threads = []
+        self._running = False
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.retries = 0
+
+    def start(self):
+        """Start the worker threads"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"rag-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"✅ Job workers started ({self.workers} threads)")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker threads (running jobs are allowed to finish)"""
+        with self._not_empty:
+            self._running = False
+            self._not_empty.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def submit(self, payload: dict, priority: int = 0, client: Optional[str] = None, weight: float = 1.0) -> Job:
+        """Queue a job; higher priority jobs are processed first, clients take turns within a priority"""
+        job = Job(payload, priority, client)
+        with self._not_empty:
+            self._purge()
+            if len(self._heap) + len(self._deferred) >= self.max_pending:
+                raise JobQueueFull(f"Job queue is full ({self.max_pending} pending jobs)")
+            self._jobs[job.id] = job
+            key = (priority, client)
+            start = max(self._virtual_time.get(priority, 0.0), self._last_finish.get(key, 0.0))
+            finish = start + 1.0 / max(weight, 1e-6)
+            self._last_finish[key] = finish
+            heapq.heappush(self._heap, (-priority, finish, next(self._sequence), job.id))
+            self._not_empty.notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Block until the job finishes or the timeout expires (long polling)"""
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count(QUEUED),
+            "deferred": len(self._deferred),
+            "running": statuses.count(RUNNING),
+            "stored": len(statuses),
+            "completed": self.completed,
+            "failed": self.failed,
+            "expired": self.expired,
+            "retries": self.retries,
+        }
+
+    def _purge(self):
+        """Drop expired results and keep the store within max_results (lock must be held)"""
+        for key, finish in list(self._last_finish.items()):
+            if finish <= self._virtual_time.get(key[0], 0.0):
+                del self._last_finish[key]  # the client has no backlog left at this priority
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(finished) - self.max_results  # queued and running jobs never push results out
+        for job in finished:
+            if now - job.finished_at > self.result_ttl or excess > 0:
+                del self._jobs[job.id]
+                self.expired += 1
+                excess -= 1
+
+    def _requeue_due(self) -> Optional[float]:
+        """Move deferred jobs whose time has come back to the queue (lock must be held)
+
+        Returns:
+            float: Seconds until the next deferred job is due, or None if there is none
+        """
+        now = time.time()
+        while self._deferred and self._deferred[0][0] <= now:
+            _, entry = heapq.heappop(self._deferred)
+            heapq.heappush(self._heap, entry)  # keeps its fair-queue tag, so it is not sent to the back
+        return self._deferred[0][0] - now if self._deferred else None
+
+    def _worker(self):
+        while True:
+            with self._not_empty:
+                while self._running:
+                    next_due = self._requeue_due()
+                    if self._heap:
+                        break
+                    self._not_empty.wait(next_due)
+                if not self._running:
+                    return
+                entry = heapq.heappop(self._heap)
+                neg_priority, finish, _, job_id = entry
+                self._virtual_time[-neg_priority] = max(self._virtual_time.get(-neg_priority, 0.0), finish)
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+
+            try:
+                job.result = self.handler(job.payload)
+                status = SUCCEEDED
+            except RetryLater as e:
+                with self._not_empty:
+                    job.status = QUEUED
+                    job.started_at = None
+                    self.retries += 1
+                    heapq.heappush(self._deferred, (time.time() + max(e.delay, 0.0), entry))
+                    self._not_empty.notify()  # an idle worker may now have to wake up for it
+                continue
+            except Exception as e:
+                print(f"❌ Job {job.id} failed: {e}")
+                job.error = str(e)
+                status = FAILED
+
+            with self._lock:
+                job.status = status
+                job.finished_at = time.time()
+                if status == SUCCEEDED:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            job.done.set()
@@ -10,11 +10,13 @@ import uvicorn
 from multiprocessing import Process
 import signal
 import atexit
+from engine import OFFLINE
 
 # Set your Hugging Face token directly here (REPLACE WITH YOUR ACTUAL TOKEN)
 from huggingface_hub import login
 os.environ["HUGGINGFACE_API_TOKEN"] = "Token_Here"
-login(token=os.environ["HUGGINGFACE_API_TOKEN"])
+if not OFFLINE:  # offline profiles never contact the Hub
+    login(token=os.environ["HUGGINGFACE_API_TOKEN"])
 
 # Configuration - Dynamic based on environment
 def get_environment_config():
@@ -179,6 +181,47 @@ async def start():
                         "Ask me anything about AI governance, policies, or data management!"
             ).send()
 
+# The UI's API key is mapped to the interactive tier in the API's RAG_API_KEYS/RAG_CLIENT_TIERS
+API_HEADERS = {"X-API-Key": os.getenv("RAG_API_KEY")} if os.getenv("RAG_API_KEY") else {}
+
+# Job polling settings
+JOB_POLL_TIMEOUT = 25.0  # seconds each long-poll request waits on the server
+JOB_MAX_DURATION = 600.0  # give up on a job after this many seconds
+
+async def ask_via_jobs(client: httpx.AsyncClient, question: str, session_id: str = None):
+    """
+    Submit a question to the job API and long-poll until it finishes
+    
+    Returns:
+        dict: The job result ({"answer", "sources"}) or {"error": ...},
+              or None if the API does not expose the job endpoints
+    """
+    jobs_url = FASTAPI_URL.rsplit("/chat", 1)[0] + "/jobs"
+    print(f"📡 Submitting job to: {jobs_url}")
+    
+    response = await client.post(jobs_url, json={"question": question, "session_id": session_id})
+    if response.status_code in (404, 405):
+        return None
+    if response.status_code == 429:
+        retry_after = response.headers.get("retry-after")
+        return {"error": f"Too many requests, please retry in {retry_after}s" if retry_after else "Too many requests"}
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    print(f"🆔 Job id: {job_id}")
+    
+    deadline = time.monotonic() + JOB_MAX_DURATION
+    while time.monotonic() < deadline:
+        poll = await client.get(f"{jobs_url}/{job_id}/wait", params={"timeout": JOB_POLL_TIMEOUT})
+        poll.raise_for_status()
+        job = poll.json()
+        if job["status"] == "succeeded":
+            return job["result"]
+        if job["status"] == "failed":
+            return {"error": job.get("error")}
+        print(f"⏳ Job {job_id} still {job['status']}...")
+    
+    raise httpx.TimeoutException(f"Job {job_id} did not finish within {JOB_MAX_DURATION:.0f}s")
+
 @cl.on_message
 async def handle_message(message: cl.Message):
     """Handle incoming messages"""
@@ -190,42 +233,57 @@ async def handle_message(message: cl.Message):
     print(f"🔍 Received message: {message.content}")
     print(f"🌐 API URL: {FASTAPI_URL}")
     
+    # Chainlit session id lets the API condense follow-up questions
+    session_id = cl.user_session.get("id")
+    
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:  # Increased timeout for model loading
+        async with httpx.AsyncClient(timeout=120.0, headers=API_HEADERS) as client:  # Increased timeout for model loading (/chat fallback)
             print(f"📡 Sending request to: {FASTAPI_URL}")
             
-            # Try the new API format first
-            response = await client.post(FASTAPI_URL, json={"question": message.content})
-            
-            print(f"📨 Response status: {response.status_code}")
-            print(f"📋 Response headers: {dict(response.headers)}")
+            # Submit as a background job and long-poll, so no single HTTP call is held open for minutes
+            job_data = await ask_via_jobs(client, message.content, session_id)
             
-            if response.status_code == 200:
-                data = response.json()
-                print(f"✅ Response data keys: {list(data.keys())}")
-                
-                if "answer" in data:
-                    answer = data["answer"]
+            if job_data is not None:
+                if "answer" in job_data:
+                    answer = job_data["answer"]
                     print(f"📝 Answer length: {len(answer)} characters")
-                elif "error" in data:
-                    answer = f"❌ API Error: {data['error']}"
-                    print(f"⚠️  API returned error: {data['error']}")
                 else:
-                    answer = f"❌ Unexpected response format: {data}"
-                    print(f"🔍 Full response data: {data}")
-            elif response.status_code == 422:
-                print("🔄 Trying legacy format...")
-                # Try legacy format
-                legacy_url = FASTAPI_URL.replace("/chat", "/chat-legacy")
-                print(f"📡 Legacy URL: {legacy_url}")
-                response = await client.post(legacy_url, json={"question": message.content})
-                data = response.json()
-                answer = data.get("answer", data.get("error", "Unknown error"))
-                print(f"📝 Legacy response: {answer[:100]}...")
+                    answer = f"❌ API Error: {job_data.get('error', 'Unknown error')}"
+                    print(f"⚠️  Job failed: {job_data.get('error')}")
             else:
-                answer = f"❌ API Error: {response.status_code} - {response.text}"
-                print(f"❌ HTTP Error: {response.status_code}")
-                print(f"📄 Response text: {response.text[:200]}...")
+                print("🔄 Job API not available, falling back to /chat...")
+                # Try the new API format first
+                response = await client.post(FASTAPI_URL, json={"question": message.content, "session_id": session_id})
+            
+                print(f"📨 Response status: {response.status_code}")
+                print(f"📋 Response headers: {dict(response.headers)}")
+            
+                if response.status_code == 200:
+                    data = response.json()
+                    print(f"✅ Response data keys: {list(data.keys())}")
+                
+                    if "answer" in data:
+                        answer = data["answer"]
+                        print(f"📝 Answer length: {len(answer)} characters")
+                    elif "error" in data:
+                        answer = f"❌ API Error: {data['error']}"
+                        print(f"⚠️  API returned error: {data['error']}")
+                    else:
+                        answer = f"❌ Unexpected response format: {data}"
+                        print(f"🔍 Full response data: {data}")
+                elif response.status_code == 422:
+                    print("🔄 Trying legacy format...")
+                    # Try legacy format
+                    legacy_url = FASTAPI_URL.replace("/chat", "/chat-legacy")
+                    print(f"📡 Legacy URL: {legacy_url}")
+                    response = await client.post(legacy_url, json={"question": message.content})
+                    data = response.json()
+                    answer = data.get("answer", data.get("error", "Unknown error"))
+                    print(f"📝 Legacy response: {answer[:100]}...")
+                else:
+                    answer = f"❌ API Error: {response.status_code} - {response.text}"
+                    print(f"❌ HTTP Error: {response.status_code}")
+                    print(f"📄 Response text: {response.text[:200]}...")
                 
     except httpx.ConnectError as e:
         print(f"🔌 Connection error: {e}")
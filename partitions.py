@@ -0,0 +1,221 @@
+"""
+Per-partition in-memory indexes over the ChromaDB collection.
+
+Chunks are grouped by source document so that a filtered search only scans
+the rows of the requested documents instead of the whole collection.
+"""
+
+import os
+import threading
+import weakref
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+def source_name(metadata: Optional[dict]) -> str:
+    """Return the document filename a chunk was loaded from"""
+    source = (metadata or {}).get("source") or "unknown"
+    return os.path.basename(str(source))
+
+
+def doc_type_of(metadata: Optional[dict]) -> str:
+    """Return the document type of a chunk (explicit metadata or file extension)"""
+    metadata = metadata or {}
+    if metadata.get("doc_type"):
+        return str(metadata["doc_type"]).lower()
+    extension = os.path.splitext(source_name(metadata))[1]
+    return extension.lstrip(".").lower() or "unknown"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class PartitionedIndex:
+    """Cosine-similarity index whose rows are laid out contiguously per source"""
+
+    def __init__(self, ids: Sequence[str], embeddings, documents: Sequence[str], metadatas: Sequence[dict]):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        sources = [source_name(m) for m in metadatas]
+
+        # Sort rows by source so every partition is a contiguous slice (a view, not a copy)
+        order = sorted(range(len(ids)), key=lambda i: sources[i])
+        self.ids = [ids[i] for i in order]
+        self.documents = [documents[i] for i in order]
+        self.metadatas = [metadatas[i] or {} for i in order]
+        self.embeddings = _normalize(embeddings[order]) if len(order) else embeddings.reshape(0, 0)
+        self._build_partitions()
+
+    def _build_partitions(self):
+        self.doc_types = np.array([doc_type_of(m) for m in self.metadatas], dtype=object)
+        self.partitions: Dict[str, Tuple[int, int]] = {}
+        for row, metadata in enumerate(self.metadatas):
+            name = source_name(metadata)
+            start, _ = self.partitions.get(name, (row, row))
+            self.partitions[name] = (start, row + 1)
+
+    @classmethod
+    def from_arrays(cls, ids, embeddings, documents, metadatas) -> "PartitionedIndex":
+        """Rebuild an index from rows that are already sorted and normalized (e.g. a memory-mapped snapshot)"""
+        index = cls.__new__(cls)
+        index.ids = list(ids)
+        index.documents = list(documents)
+        index.metadatas = [m or {} for m in metadatas]
+        index.embeddings = embeddings
+        index._build_partitions()
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "PartitionedIndex":
+        """Build the index from everything stored in a Chroma vectorstore"""
+        data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+        return cls(data["ids"], data["embeddings"], data["documents"], data["metadatas"])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.embeddings.nbytes)
+
+    def list_sources(self) -> List[dict]:
+        """Summarize the partitions (source filename, doc type and chunk count)"""
+        return [
+            {
+                "source": name,
+                "doc_type": str(self.doc_types[start]),
+                "chunks": end - start,
+            }
+            for name, (start, end) in sorted(self.partitions.items())
+        ]
+
+    def _slices(self, sources: Optional[Sequence[str]]) -> List[Tuple[int, int]]:
+        if not sources:
+            return [(0, len(self.ids))]
+        wanted = {os.path.basename(s) for s in sources}
+        return [self.partitions[name] for name in sorted(wanted) if name in self.partitions]
+
+    def search_by_vector(
+        self,
+        query_embedding,
+        k: int = 5,
+        sources: Optional[Sequence[str]] = None,
+        doc_type: Optional[str] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Return the k most similar chunks (with cosine scores) inside the requested partitions"""
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        return self.search_batch(query, k=k, sources=sources, doc_type=doc_type)[0]
+
+    def search_batch(
+        self,
+        query_embeddings,
+        k: int = 5,
+        sources: Optional[Sequence[str]] = None,
+        doc_type: Optional[str] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Vectorized search of many queries against the same partitions in one pass"""
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        rows, scores = [], []
+        for start, end in self._slices(sources):
+            if end <= start:
+                continue
+            block = self.embeddings[start:end] @ queries.T
+            row_ids = np.arange(start, end)
+            if doc_type:
+                mask = self.doc_types[start:end] == doc_type.lower()
+                block, row_ids = block[mask], row_ids[mask]
+            rows.append(row_ids)
+            scores.append(block)
+
+        if not rows or sum(len(r) for r in rows) == 0:
+            return [[] for _ in range(len(queries))]
+
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores, axis=0)
+        k = min(k, len(rows))
+
+        results = []
+        for column in range(scores.shape[1]):
+            column_scores = scores[:, column]
+            top = np.argpartition(-column_scores, k - 1)[:k]
+            top = top[np.argsort(-column_scores[top])]
+            results.append([(self.document(rows[i]), float(column_scores[i])) for i in top])
+        return results
+
+    def document(self, row: int) -> Document:
+        metadata = dict(self.metadatas[row])
+        metadata.setdefault("id", self.ids[row])
+        return Document(page_content=self.documents[row], metadata=metadata)
+
+
+class SourceCatalog:
+    """Source filenames and doc types of a collection, read from chunk metadata only (fallback path)"""
+
+    def __init__(self, metadatas: Sequence[dict]):
+        self.stored: Dict[str, set] = {}  # filename -> `source` values as stored in Chroma
+        self.doc_types: Dict[str, str] = {}  # stored `source` value -> doc type
+        self.chunks: Dict[str, int] = {}  # filename -> chunk count
+        for metadata in metadatas:
+            metadata = metadata or {}
+            if not metadata.get("source"):
+                continue
+            stored, name = str(metadata["source"]), source_name(metadata)
+            self.stored.setdefault(name, set()).add(stored)
+            self.doc_types.setdefault(stored, doc_type_of(metadata))
+            self.chunks[name] = self.chunks.get(name, 0) + 1
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "SourceCatalog":
+        return cls(vectorstore.get(include=["metadatas"])["metadatas"])
+
+    def resolve(self, sources: Optional[Sequence[str]] = None, doc_type: Optional[str] = None) -> Optional[List[str]]:
+        """
+        Map request filters to stored `source` values, matching them the way PartitionedIndex does
+
+        Returns:
+            list: stored values to filter on (empty when nothing matches), or None when unfiltered
+        """
+        if not sources and not doc_type:
+            return None
+        names = {os.path.basename(s) for s in sources} if sources else set(self.stored)
+        stored = [value for name in names for value in self.stored.get(name, ())]
+        if doc_type:
+            stored = [value for value in stored if self.doc_types[value] == doc_type.lower()]
+        return sorted(stored)
+
+    def list_sources(self) -> List[dict]:
+        return [
+            {
+                "source": name,
+                "doc_type": self.doc_types[min(self.stored[name])],
+                "chunks": self.chunks[name],
+            }
+            for name in sorted(self.stored)
+        ]
+
+
+_catalogs = weakref.WeakKeyDictionary()
+_catalogs_lock = threading.Lock()
+
+
+def source_catalog(vectorstore) -> SourceCatalog:
+    """The (cached) source catalog of a vector store"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(vectorstore)
+        if catalog is None:
+            catalog = _catalogs[vectorstore] = SourceCatalog.from_vectorstore(vectorstore)
+        return catalog
+
+
+def chroma_filter(stored_sources: Optional[Sequence[str]]) -> Optional[dict]:
+    """Translate resolved source filters (see SourceCatalog.resolve) into a Chroma `where` clause"""
+    if stored_sources is None:
+        return None
+    return {"source": {"$in": list(stored_sources)}}
@@ -0,0 +1,106 @@
+"""
+On-demand profiling helpers for the API.
+
+- `SamplingProfiler`: samples the stacks of every thread for N seconds and
+  returns them in collapsed-stack format (one "frame;frame;frame count" line
+  per stack), which flamegraph.pl, speedscope and inferno read directly.
+- `profile_call`: runs a single call under cProfile and returns its hottest
+  functions.
+- `merge_profiles`: combines the profiles of several phases of one request.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling all Python threads at a fixed interval"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+
+    def run(self, seconds: float) -> str:
+        """Sample for `seconds` (blocking) and return the collapsed stacks"""
+        stacks = Counter()
+        me = threading.get_ident()
+        names = {}
+        deadline = time.perf_counter() + seconds
+
+        while time.perf_counter() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def profile_call(func, *args, top: Optional[int] = 25, **kwargs):
+    """
+    Run func(*args, **kwargs) under cProfile
+
+    Returns:
+        tuple: (the call's result, list of the `top` functions by cumulative time; all of them if top is None)
+    """
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    result = profiler.runcall(func, *args, **kwargs)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return result, {"wall_ms": round(wall_ms, 3), "top_functions": rows[:top] if top else rows}
+
+
+def merge_profiles(phases: dict, top: int = 25) -> dict:
+    """
+    Merge profile_call results of consecutive phases of one request (e.g. retrieval, then the LLM call)
+
+    `phases` maps phase names to profiles taken with top=None; time outside the
+    profiled phases (such as waiting for an LLM slot) can be added as plain milliseconds.
+    """
+    functions = {}
+    wall_ms = 0.0
+    phase_ms = {}
+    for name, profile in phases.items():
+        if isinstance(profile, dict):
+            phase_ms[name] = profile["wall_ms"]
+            for row in profile["top_functions"]:
+                merged = functions.setdefault(row["function"], {**row, "calls": 0, "total_ms": 0.0, "cumulative_ms": 0.0})
+                merged["calls"] += row["calls"]
+                merged["total_ms"] = round(merged["total_ms"] + row["total_ms"], 3)
+                merged["cumulative_ms"] = round(merged["cumulative_ms"] + row["cumulative_ms"], 3)
+        else:
+            phase_ms[name] = round(profile, 3)
+        wall_ms += phase_ms[name]
+    rows = sorted(functions.values(), key=lambda row: row["cumulative_ms"], reverse=True)
+    return {"wall_ms": round(wall_ms, 3), "phases_ms": phase_ms, "top_functions": rows[:top]}
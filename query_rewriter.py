@@ -0,0 +1,190 @@
+"""
+History-aware query condensation.
+
+Follow-up questions such as "what about its penalties?" are rewritten into
+standalone retrieval queries before they reach the retriever. Questions that
+are already standalone are passed through untouched, so single-shot queries
+pay no extra latency.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+# Words that refer back to something said earlier in the conversation
+ANAPHORA = {
+    "it", "its", "it's", "itself", "they", "them", "their", "theirs", "he", "she", "his", "her",
+}
+
+# Demonstratives are usually determiners or relative pronouns ("the obligations that apply"); they only
+# refer back when they end the question or directly follow an auxiliary ("what does that mean?")
+DEMONSTRATIVES = {"this", "that", "these", "those"}
+AUXILIARIES = {
+    "is", "are", "was", "were", "does", "do", "did", "can", "could", "should", "would", "will", "about",
+}
+
+FOLLOW_UP_PREFIXES = (
+    "what about", "how about", "and ", "also ", "what else",
+    "can you elaborate", "tell me more", "more on", "same for", "and what",
+)
+
+# Whole questions that only make sense as follow-ups
+FOLLOW_UP_QUESTIONS = {"why", "why not", "how so", "how come", "really"}
+
+PRONOUN_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted((ANAPHORA | DEMONSTRATIVES) - {"it's"}, key=len, reverse=True)) + r")\b", re.IGNORECASE
+)
+
+QUESTION_LEAD = re.compile(
+    r"^(what|which|who|whom|whose|where|when|why|how|does|do|did|is|are|was|were|can|could|should|would|will|"
+    r"explain|define|describe|list|tell me about)\b[\s,]*"
+    r"((is|are|was|were|does|do|did|the purpose of|the role of|meant by|mean by)\b\s*)?",
+    re.IGNORECASE,
+)
+
+REWRITE_PROMPT = """Rewrite the follow-up question into a standalone question that can be understood without the conversation.
+Keep it short, keep every named entity, and answer with the rewritten question only.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+
+Standalone question:"""
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-zA-Z']+", text.lower())
+
+
+def _refers_back(text: str, match) -> bool:
+    """Whether a pronoun match refers to an earlier turn (demonstratives only in anaphoric positions)"""
+    if match.group(0).lower() not in DEMONSTRATIVES:
+        return True
+    before = _words(text[:match.start()])
+    after = _words(text[match.end():])
+    return not after or (bool(before) and before[-1] in AUXILIARIES)
+
+
+def is_standalone(question: str) -> bool:
+    """True when the question does not refer back to earlier turns"""
+    lowered = question.strip().lower()
+    if lowered.startswith(FOLLOW_UP_PREFIXES) or " ".join(_words(lowered)) in FOLLOW_UP_QUESTIONS:
+        return False
+    return not any(_refers_back(lowered, match) for match in PRONOUN_PATTERN.finditer(lowered))
+
+
+def extract_topic(question: str) -> str:
+    """Strip question words from a previous question to get its topic ("What is the EU AI Act?" -> "the EU AI Act")"""
+    topic = question.strip().rstrip("?.! ")
+    topic = QUESTION_LEAD.sub("", topic).strip()
+    return topic or question.strip().rstrip("?.! ")
+
+
+def rule_based_rewrite(question: str, previous_question: str) -> str:
+    """Resolve pronouns and elliptical follow-ups against the previous user question"""
+    topic = extract_topic(previous_question)
+    stripped = question.strip()
+    lowered = stripped.lower()
+
+    def resolve(text: str) -> str:
+        def substitute(match):
+            word = match.group(0).lower()
+            if not _refers_back(text, match):
+                return match.group(0)
+            if word in ("its", "their", "theirs", "his", "her"):
+                return f"{topic}'s"
+            return topic
+
+        return PRONOUN_PATTERN.sub(substitute, text)
+
+    for prefix in ("and what about", "what about", "how about", "same for"):
+        if lowered.startswith(prefix):
+            subject = stripped[len(prefix):].strip(" ?.!")
+            resolved = resolve(subject)
+            if resolved != subject:
+                # "what about its penalties?" -> "the EU AI Act's penalties?"
+                return f"{resolved}?"
+            # "what about GDPR?" -> ask the previous question about the new subject
+            previous = previous_question.strip()
+            if topic and topic in previous:
+                return previous.replace(topic, subject)
+            return f"{previous.rstrip('?.! ')} - {subject}?"
+
+    rewritten = resolve(stripped)
+    if rewritten == stripped:
+        # Nothing to substitute (e.g. "why?"): anchor the follow-up to the previous topic
+        rewritten = f"{stripped.rstrip('?.! ')} ({topic})?"
+    return rewritten
+
+
+class QueryRewriter:
+    """Condenses follow-up questions into standalone queries, with an LRU cache of rewrites"""
+
+    def __init__(self, llm: Optional[Callable[[list], str]] = None, cache_size: int = 1024, history_turns: int = 3):
+        self.llm = llm
+        self.cache_size = cache_size
+        self.history_turns = history_turns
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def rewrite(self, question: str, history: list, session_id: Optional[str] = None) -> str:
+        """Return a standalone version of the question (the question itself if already standalone)"""
+        user_turns = [m["content"] for m in history if m.get("role") == "user"]
+        if not user_turns or is_standalone(question):
+            self.skipped += 1
+            return question
+
+        key = (session_id, user_turns[-1], question.strip().lower())
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        rewritten = self._rewrite(question, history, user_turns[-1])
+
+        with self._lock:
+            self._cache[key] = rewritten
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rewritten
+
+    def _rewrite(self, question: str, history: list, previous_question: str) -> str:
+        if self.llm is not None:
+            try:
+                recent = history[-2 * self.history_turns:]
+                transcript = "\n".join(f"{m['role']}: {m['content'][:300]}" for m in recent)
+                rewritten = self.llm([
+                    {"role": "user", "content": REWRITE_PROMPT.format(history=transcript, question=question)}
+                ]).strip()
+                if rewritten:
+                    return rewritten
+            except Exception as e:
+                print(f"⚠️  LLM query rewrite failed, using rule-based resolver: {e}")
+        return rule_based_rewrite(question, previous_question)
+
+    def export_cache(self) -> list:
+        """Return the cached rewrites as JSON-serializable [key, rewrite] pairs (oldest first)"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._cache.items()]
+
+    def load_cache(self, items: list):
+        """Restore rewrites saved with export_cache"""
+        with self._lock:
+            for key, value in items[-self.cache_size:]:
+                self._cache[tuple(key)] = value
+
+    def stats(self) -> dict:
+        return {
+            "mode": "llm" if self.llm is not None else "rule-based",
+            "cache_size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+        }
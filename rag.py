@@ -1,21 +1,39 @@
+from engine import OFFLINE  # first: sets the Hugging Face offline flags before they are imported
 from langchain.prompts import PromptTemplate
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from langchain.llms import HuggingFacePipeline
 
-from langchain.vectorstores import Chroma
 from langchain.embeddings import HuggingFaceEmbeddings
 
+from partitions import PartitionedIndex, doc_type_of, source_catalog, source_name
+from corpus_registry import (
+    CorpusRegistry, close_vectorstore, discover_corpora, open_vectorstore, search_store, search_store_batch
+)
+from query_rewriter import QueryRewriter
+from snapshot import chroma_fingerprint, embedder_path, load_snapshot, prune_snapshots, save_embedder, save_snapshot
+from index_handle import IndexHandle, IndexVersion
+from state_store import create_state_store
+from extractive import ExtractiveAnswerer
+
 from transformers import pipeline
 import torch
 import os
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from langchain_core.documents import Document
 from together import Together
 
 # Set your Hugging Face token directly here (REPLACE WITH YOUR ACTUAL TOKEN)
 from huggingface_hub import login
 os.environ["HUGGINGFACE_API_TOKEN"] = "Token_Here"
-login(token=os.environ["HUGGINGFACE_API_TOKEN"])
+if not OFFLINE:  # offline profiles never contact the Hub
+    login(token=os.environ["HUGGINGFACE_API_TOKEN"])
 # os.environ["TOGETHER_API_KEY"] = "Token_Here"
 
 # Global variables to store initialized components
@@ -23,14 +41,77 @@ embedding_model = None
 vectorstore = None
 retriever = None
 llm = None
+llm_stream = None  # streaming variant of llm: llm_stream(messages, cancel) yields text deltas
 rag_chain = None
+partition_index = None
+corpus_registry = None
+rewrite_llm = None
+query_rewriter = None
 chat_history = []
+state_store = create_state_store()  # sessions and shared caches; see initialize_state_store()
+snapshot_caches = {}  # hot caches restored from a warm-restart snapshot
+index_handle = IndexHandle(close=close_vectorstore)  # versioned pointer to the active default index (hot-swappable)
+recent_queries = deque(maxlen=int(os.getenv("RAG_WARMUP_QUERIES", "32")))  # replayed to warm a new index
+reload_lock = threading.Lock()
+reload_status = {"state": "idle"}
+index_watcher = None
+
+EMBEDDING_MODEL_NAME = "BAAI/bge-base-en-v1.5"
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "32"))
+LOCAL_LLM_MODEL = os.getenv("RAG_LOCAL_LLM_MODEL", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+LOCAL_LLM_MAX_TOKENS = int(os.getenv("RAG_LOCAL_LLM_MAX_TOKENS", "256"))
+CHROMA_PATH = "chroma_db"
+SNAPSHOT_DIR = os.getenv("RAG_SNAPSHOT_DIR", "snapshots")
+DEFAULT_CORPUS = "default"  # the CHROMA_PATH store, always resident
+CORPORA_DIR = os.getenv("RAG_CORPORA_DIR", "corpora")  # one ChromaDB directory per additional corpus
+CORPUS_MEMORY_BUDGET_MB = int(os.getenv("RAG_CORPUS_MEMORY_MB", "1024"))
+BUILD_PARTITIONS = os.getenv("RAG_BUILD_PARTITIONS", "true").lower() == "true"  # in-RAM copy of the embeddings
+DEFAULT_K = 5
+MIN_K = int(os.getenv("RAG_MIN_K", "2"))
+MAX_K = int(os.getenv("RAG_MAX_K", "8"))
+SCORE_GAP = float(os.getenv("RAG_SCORE_GAP", "0.08"))  # stop adding chunks after a drop this large
+MIN_RELEVANCE = float(os.getenv("RAG_MIN_RELEVANCE", "0.6"))  # cosine; calibrate with evaluate_retrieval.py --off-topic
+IDK_ANSWER = "I don't know."
+STATE_STORE_URL = os.getenv("RAG_STATE_URL")  # e.g. redis://localhost:6379/0, in-process when unset
+STATE_NEAR_CACHE_TTL = float(os.getenv("RAG_STATE_NEAR_CACHE_TTL", "5"))  # client-side cache for shared caches
+STATE_MAX_KEYS = int(os.getenv("RAG_STATE_MAX_KEYS", "100000"))  # in-process store only
+SESSION_TTL = float(os.getenv("RAG_SESSION_TTL", "86400"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))  # 0 disables the answer cache
+RETRIEVAL_CACHE_TTL = float(os.getenv("RAG_RETRIEVAL_CACHE_TTL", "3600"))  # 0 disables the retrieval cache
+MAX_HISTORY_TURNS = int(os.getenv("RAG_MAX_HISTORY_TURNS", "5"))
+REWRITE_CACHE_SIZE = int(os.getenv("RAG_REWRITE_CACHE_SIZE", "1024"))
+EXTRACTIVE_ENABLED = os.getenv("RAG_EXTRACTIVE", "true").lower() == "true"
+EXTRACTIVE_MIN_CONFIDENCE = float(os.getenv("RAG_EXTRACTIVE_MIN_CONFIDENCE", "0.6"))  # below this the LLM answers
+
+extractive_answerer = ExtractiveAnswerer(min_confidence=EXTRACTIVE_MIN_CONFIDENCE)  # LLM-free definition answers
+
+SYSTEM_PROMPT = """You are an AI-powered policy assistant specialized in AI and Data Governance.
+Your role is to support users by interpreting and explaining governance frameworks, ethical standards, compliance guidelines, and policy definitions.
+
+Instructions:
+1. Base your answer only on the provided context.
+2. List the filenames of the documents you used (e.g., 'AI_Principles Document') under the "Sources" section.
+3. If the context does not contain the answer, respond with exactly: "I don't know."
+4. Do not make assumptions or add any information not explicitly stated in the context.
+
+Question: {question}
+
+Context: {context}
+
+Answer:"""
 
 def initialize_embeddings():
     """Initialize the embedding model"""
     global embedding_model
     print("🔄 Initializing embeddings...")
-    embedding_model = HuggingFaceEmbeddings(model_name="BAAI/bge-base-en-v1.5")
+    
+    # Prefer the copy saved by a snapshot: no Hugging Face Hub round trips on boot
+    local_model = embedder_path(SNAPSHOT_DIR, EMBEDDING_MODEL_NAME)
+    if os.path.exists(os.path.join(local_model, "modules.json")):
+        print(f"📦 Using snapshot embedder: {local_model}")
+        embedding_model = HuggingFaceEmbeddings(model_name=local_model, encode_kwargs={"batch_size": EMBED_BATCH_SIZE})
+    else:
+        embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs={"batch_size": EMBED_BATCH_SIZE})
     print("✅ Embeddings initialized successfully")
     return embedding_model
 
@@ -39,18 +120,160 @@ def initialize_vectorstore():
     global vectorstore, retriever
     print("🔄 Loading ChromaDB...")
     
-    if not os.path.exists("chroma_db"):
-        raise FileNotFoundError("ChromaDB directory 'chroma_db' not found!")
-    
-    vectorstore = Chroma(
-        persist_directory="chroma_db",  # path to your saved local DB
-        embedding_function=embedding_model
-    )
-    
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+    version = load_index_version(CHROMA_PATH, use_snapshot=True)
+    activate_index(version)
     print("✅ ChromaDB loaded successfully")
     return vectorstore, retriever
 
+def load_index_version(path: str, use_snapshot: bool = False) -> IndexVersion:
+    """Open a ChromaDB directory and build its partitioned index (without activating it)"""
+    global snapshot_caches
+    
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"ChromaDB directory '{path}' not found!")
+    
+    # A fresh client: reloading the same path must not reuse the old version's Chroma state
+    store = open_vectorstore(path, embedding_model)
+    fingerprint = chroma_fingerprint(path)
+    next_version = (index_handle.current.version + 1) if index_handle.current else 1
+
+    if use_snapshot:
+        try:
+            start = time.perf_counter()
+            snapshot = load_snapshot(SNAPSHOT_DIR, fingerprint, EMBEDDING_MODEL_NAME)
+            if snapshot is not None:
+                index, snapshot_caches = snapshot
+                print(f"✅ Loaded partitions from snapshot ({len(index)} chunks, {time.perf_counter() - start:.2f}s)")
+                return IndexVersion(next_version, path, store, index, fingerprint)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable snapshot: {e}")
+
+    if not BUILD_PARTITIONS:
+        print("ℹ️  Partitions disabled, using ChromaDB filters")
+        return IndexVersion(next_version, path, store, None, fingerprint)
+
+    print("🔄 Building per-source partitions...")
+    try:
+        index = PartitionedIndex.from_vectorstore(store)
+        print(f"✅ Partitioned {len(index)} chunks into {len(index.partitions)} sources")
+    except Exception as e:
+        # Filtered searches fall back to Chroma `where` clauses
+        index = None
+        print(f"⚠️  Could not build partitions, using ChromaDB filters instead: {e}")
+
+    return IndexVersion(next_version, path, store, index, fingerprint)
+
+def activate_index(version: IndexVersion):
+    """Swap a loaded index version in atomically (in-flight requests finish on the old one)"""
+    global vectorstore, retriever, partition_index
+    
+    previous = index_handle.install(version)
+    # Module-level aliases kept for the LCEL chain and older callers
+    vectorstore = version.vectorstore
+    partition_index = version.index
+    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": DEFAULT_K})
+    if rag_chain is not None:
+        create_rag_chain()
+    
+    if previous is not None:
+        print(f"🔁 Index version {version.version} active (version {previous.version} draining)")
+    return previous
+
+def warm_index(version: IndexVersion, queries) -> int:
+    """Replay recent queries against a new index so its pages and caches are hot before the swap"""
+    warmed = 0
+    for question in queries:
+        try:
+            search_store(version.vectorstore, version.index, embedding_model, question, MAX_K)
+            warmed += 1
+        except Exception as e:
+            print(f"⚠️  Warm-up query failed: {e}")
+    return warmed
+
+def reload_index(path=None, wait: bool = False) -> dict:
+    """
+    Build (or load) a new index version in the background, warm it and swap it in
+    
+    Args:
+        path (str): ChromaDB directory of the new index (defaults to the active one)
+        wait (bool): Block until the swap is done
+        
+    Returns:
+        dict: The reload status
+    """
+    if not reload_lock.acquire(blocking=False):
+        return dict(reload_status)
+    
+    path = path or (index_handle.current.path if index_handle.current else CHROMA_PATH)
+    reload_status.clear()
+    reload_status.update({"state": "loading", "path": path, "started_at": time.time()})
+    
+    def _reload():
+        try:
+            start = time.perf_counter()
+            version = load_index_version(path)
+            reload_status["state"] = "warming"
+            warmed = warm_index(version, list(recent_queries))
+            activate_index(version)
+            reload_status.update({
+                "state": "swapped",
+                "version": version.version,
+                "warmed_queries": warmed,
+                "seconds": round(time.perf_counter() - start, 3),
+                "finished_at": time.time()
+            })
+            print(f"✅ Index hot-swapped to version {version.version} ({warmed} warm-up queries)")
+        except Exception as e:
+            print(f"❌ Index reload failed, keeping the current version: {e}")
+            reload_status.update({"state": "failed", "error": str(e), "finished_at": time.time()})
+        finally:
+            reload_lock.release()
+    
+    thread = threading.Thread(target=_reload, name="rag-index-reload", daemon=True)
+    thread.start()
+    if wait:
+        thread.join()
+    return dict(reload_status)
+
+def index_status() -> dict:
+    """Describe the active and draining index versions and the last reload"""
+    status = index_handle.describe()
+    status["reload"] = dict(reload_status)
+    status["watcher"] = index_watcher is not None
+    return status
+
+def start_index_watcher(interval: float):
+    """Poll the active ChromaDB directory and hot-swap when its files change"""
+    global index_watcher
+    if index_watcher is not None or interval <= 0:
+        return index_watcher
+    
+    def _watch():
+        pending = None
+        while True:
+            time.sleep(interval)
+            current = index_handle.current
+            if current is None:
+                continue
+            try:
+                fingerprint = chroma_fingerprint(current.path)
+            except OSError:
+                continue
+            if fingerprint == current.fingerprint:
+                pending = None
+            elif fingerprint == pending:
+                # Unchanged for a full interval: the writer is done
+                print(f"👀 {current.path} changed on disk, reloading index...")
+                reload_index(current.path)
+                pending = None
+            else:
+                pending = fingerprint
+    
+    index_watcher = threading.Thread(target=_watch, name="rag-index-watcher", daemon=True)
+    index_watcher.start()
+    print(f"👀 Watching the active ChromaDB directory for changes every {interval}s")
+    return index_watcher
+
 '''def initialize_llm():
     """Initialize the Language Model"""
     global llm
@@ -131,15 +354,379 @@ def initialize_llm():
                 )
                 return response.choices[0].message.content.strip()'''
 
+            def _llm_stream(messages, cancel=None):
+                """Yield the answer as it is generated; closing the stream aborts the upstream call"""
+                stream = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=512,
+                    top_p=0.9,
+                    stream=True
+                )
+                try:
+                    for chunk in stream:
+                        if cancel is not None and cancel.is_set():
+                            return
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                finally:
+                    close = getattr(stream, "close", None)
+                    if close is not None:
+                        close()
+
             # Set the global llm to the defined function
             llm = _llm
             globals()["llm"] = llm
+            globals()["llm_stream"] = _llm_stream
+
+            # Optional small, fast model used only to condense follow-up questions
+            rewrite_model_name = os.getenv("QUERY_REWRITE_MODEL")
+            if rewrite_model_name:
+                print(f"📦 Using query rewrite model: {rewrite_model_name}")
+
+                def _rewrite_llm(messages):
+                    response = client.chat.completions.create(
+                        model=rewrite_model_name,
+                        messages=messages,
+                        temperature=0.0,
+                        max_tokens=64
+                    )
+                    return response.choices[0].message.content.strip()
+
+                globals()["rewrite_llm"] = _rewrite_llm
 
         except Exception as e:
             print(f"❌ Error initializing Together AI model: {e}")
             print(f"🔍 Error details: {type(e).__name__}: {str(e)}")
             raise
 
+def initialize_local_llm():
+    """Initialize a small chat model on the local CPU (no network access once downloaded)"""
+    global llm, llm_stream
+    print(f"🔄 Loading local model {LOCAL_LLM_MODEL} on CPU...")
+    
+    tokenizer = AutoTokenizer.from_pretrained(LOCAL_LLM_MODEL)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(LOCAL_LLM_MODEL, torch_dtype=torch.float32)
+    pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, device=-1)
+    
+    def _llm(messages):
+        prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        output = pipe(
+            prompt,
+            max_new_tokens=LOCAL_LLM_MAX_TOKENS,
+            do_sample=False,
+            repetition_penalty=1.1,
+            return_full_text=False,
+            pad_token_id=tokenizer.eos_token_id
+        )
+        return output[0]["generated_text"].strip()
+    
+    llm = _llm
+    llm_stream = None  # stream_chat sends the whole answer as one chunk
+    print(f"✅ Local model loaded")
+    return llm
+
+def format_docs(docs) -> str:
+    """Render retrieved chunks with their source filenames so the LLM can cite them"""
+    return "\n\n".join(
+        f"[Source: {source_name(doc.metadata)}]\n{doc.page_content}" for doc in docs
+    )
+
+def initialize_query_rewriter():
+    """Initialize the follow-up question condenser (rule-based unless QUERY_REWRITE_MODEL is set)"""
+    global query_rewriter
+    query_rewriter = QueryRewriter(llm=rewrite_llm, cache_size=REWRITE_CACHE_SIZE)
+    query_rewriter.load_cache(snapshot_caches.get("query_rewrites", []))
+    print(f"✅ Query rewriter ready ({query_rewriter.stats()['mode']})")
+    return query_rewriter
+
+def save_engine_snapshot():
+    """
+    Save the initialized engine state (index, embedder, hot caches) for warm restarts
+
+    Returns:
+        str: The snapshot directory, or None if there is nothing to save
+    """
+    active = index_handle.current
+    if active is None or active.index is None:
+        print("⚠️  No partitions loaded, skipping snapshot")
+        return None
+
+    print("💾 Saving engine snapshot...")
+    start = time.perf_counter()
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    save_embedder(SNAPSHOT_DIR, EMBEDDING_MODEL_NAME, embedding_model)
+    caches = {"query_rewrites": query_rewriter.export_cache() if query_rewriter else []}
+    path = save_snapshot(SNAPSHOT_DIR, active.fingerprint, active.index, EMBEDDING_MODEL_NAME, caches)
+    prune_snapshots(SNAPSHOT_DIR, keep=path)
+    print(f"✅ Snapshot saved to {path} ({time.perf_counter() - start:.2f}s)")
+    return path
+
+def initialize_state_store():
+    """Initialize the state store shared by all API replicas (RAG_STATE_URL)"""
+    global state_store
+    state_store = create_state_store(STATE_STORE_URL, near_cache_ttl=STATE_NEAR_CACHE_TTL, max_keys=STATE_MAX_KEYS)
+    if hasattr(state_store, "backend"):
+        state_store.backend.ping()
+    print(f"✅ State store ready ({state_store.stats()['backend']})")
+    return state_store
+
+def state_store_stats() -> dict:
+    return state_store.stats()
+
+def get_history(session_id=None) -> list:
+    """Return the prior conversation turns of a session"""
+    if session_id is None:
+        return chat_history
+    return state_store.get_json(f"session:{session_id}", [])
+
+def record_turn(session_id, question: str, answer: str):
+    """Append a question/answer pair to a session, keeping the last MAX_HISTORY_TURNS turns"""
+    if session_id is None:
+        return
+    history = get_history(session_id) + [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer}
+    ]
+    state_store.set_json(f"session:{session_id}", history[-2 * MAX_HISTORY_TURNS:], SESSION_TTL)
+
+def cache_key(kind: str, query: str, sources=None, doc_type=None, corpus=None) -> str:
+    """Shared cache key for a query, its filters and the index version it was answered from"""
+    if corpus in (None, DEFAULT_CORPUS):
+        active = index_handle.current
+        index_id = (active.fingerprint or active.path) if active else CHROMA_PATH
+    else:
+        index_id = corpus
+    payload = json.dumps([index_id, " ".join(query.lower().split()), sorted(sources or []), doc_type])
+    return f"{kind}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+def cached_retrieve(query: str, sources=None, doc_type=None, corpus=None):
+    """retrieve_documents() through the shared retrieval cache"""
+    if RETRIEVAL_CACHE_TTL <= 0:
+        return retrieve_documents(query, sources=sources, doc_type=doc_type, corpus=corpus)
+    key = cache_key("retrieval", query, sources, doc_type, corpus)
+    cached = state_store.get_json(key)
+    if cached is not None:
+        return [(Document(page_content=text, metadata=metadata), score) for text, metadata, score in cached]
+    docs_with_scores = retrieve_documents(query, sources=sources, doc_type=doc_type, corpus=corpus)
+    state_store.set_json(
+        key, [[doc.page_content, doc.metadata, float(score)] for doc, score in docs_with_scores], RETRIEVAL_CACHE_TTL
+    )
+    return docs_with_scores
+
+def condense_question(question: str, history: list, session_id=None) -> str:
+    """Rewrite a follow-up into a standalone retrieval query (no-op for standalone questions)"""
+    if query_rewriter is None or not history:
+        return question
+    standalone = query_rewriter.rewrite(question, history, session_id)
+    if standalone != question:
+        print(f"✏️  Rewrote follow-up as: {standalone}")
+    return standalone
+
+def build_messages(context, question, history=None):
+    """Build the chat messages sent to the LLM"""
+    if history is None:
+        history = chat_history
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,  # ← this will hold prior conversation turns
+        {"role": "user", "content": f"{question}\n\nContext:\n{context}"}
+    ]
+
+def initialize_corpus_registry():
+    """Register the additional corpora (opened lazily on first use)"""
+    global corpus_registry
+    corpora = discover_corpora(CORPORA_DIR, os.getenv("RAG_CORPORA"))
+    corpora.pop(DEFAULT_CORPUS, None)
+    corpus_registry = CorpusRegistry(corpora, embedding_model, CORPUS_MEMORY_BUDGET_MB * 1024 * 1024)
+    print(f"✅ Corpus registry ready ({len(corpora)} additional corpora, budget {CORPUS_MEMORY_BUDGET_MB} MB)")
+    return corpus_registry
+
+def has_corpus(corpus=None) -> bool:
+    """True if the corpus name can be served"""
+    if corpus in (None, DEFAULT_CORPUS):
+        return True
+    return corpus_registry is not None and corpus in corpus_registry
+
+def list_corpora() -> dict:
+    """Describe the default and registered corpora with load/eviction metrics"""
+    metrics = corpus_registry.metrics() if corpus_registry is not None else {"available": []}
+    metrics["default"] = DEFAULT_CORPUS
+    metrics["available"] = [DEFAULT_CORPUS] + metrics["available"]
+    return metrics
+
+def retrieve_documents(question: str, k: int = MAX_K, sources=None, doc_type=None, corpus=None):
+    """
+    Retrieve the top-k chunks for a question, optionally restricted to some sources or a doc type
+
+    Filters are pushed down into the search: with partitions only the matching
+    slices are scanned, otherwise they become a ChromaDB `where` clause.
+    `corpus` selects a registered corpus (the default store when omitted).
+
+    Returns:
+        list: (Document, score) pairs, best first
+    """
+    if corpus not in (None, DEFAULT_CORPUS):
+        return corpus_registry.search(corpus, question, k, sources, doc_type)
+    recent_queries.append(question)
+    with index_handle.acquire() as active:
+        return search_store(active.vectorstore, active.index, embedding_model, question, k, sources, doc_type)
+
+def retrieve_documents_batch(questions, k: int = MAX_K, sources=None, doc_type=None, corpus=None):
+    """
+    Retrieve chunks for many questions at once
+
+    All questions are embedded in a single batched call and searched in one
+    vectorized pass (or one batched ChromaDB query when partitions are unavailable).
+
+    Returns:
+        list: one list of (Document, score) pairs per question
+    """
+    if not questions:
+        return []
+
+    query_embeddings = embedding_model.embed_documents(list(questions))
+    if corpus not in (None, DEFAULT_CORPUS):
+        return corpus_registry.search_batch(corpus, query_embeddings, k, sources, doc_type)
+    with index_handle.acquire() as active:
+        return search_store_batch(active.vectorstore, active.index, query_embeddings, k, sources, doc_type)
+
+def select_context(docs_with_scores, min_k: int = MIN_K, max_k: int = MAX_K, gap: float = SCORE_GAP,
+                   min_relevance: float = MIN_RELEVANCE) -> list:
+    """
+    Choose how many retrieved chunks to send to the LLM from their score distribution
+
+    Chunks are kept best-first until the score drops by more than `gap` (after at
+    least `min_k` chunks) or falls below `min_relevance`. An empty list means even
+    the best chunk is below `min_relevance`, i.e. the corpus cannot answer.
+    """
+    ranked = sorted(docs_with_scores, key=lambda pair: pair[1], reverse=True)[:max_k]
+    if not ranked or ranked[0][1] < min_relevance:
+        return []
+
+    selected = [ranked[0]]
+    for previous, current in zip(ranked, ranked[1:]):
+        if current[1] < min_relevance:
+            break
+        if len(selected) >= min_k and previous[1] - current[1] > gap:
+            break
+        selected.append(current)
+    return selected
+
+def generate_answer(question: str, docs_with_scores, history=None, gate=None) -> dict:
+    """
+    Call the LLM on already retrieved chunks
+
+    The LLM is skipped entirely (canned "I don't know." answer) when no chunk
+    is relevant enough. Raises on LLM errors so that callers can report them
+    per request.
+
+    Args:
+        gate: Optional callable(messages) returning a context manager held around the LLM call only
+
+    Returns:
+        dict: {"answer": str, "sources": list}
+    """
+    plan = plan_answer(question, docs_with_scores, history)
+    with llm_gate(gate, plan):
+        return call_llm(plan)
+
+def plan_answer(question: str, docs_with_scores, history=None) -> dict:
+    """
+    Everything in generate_answer before the LLM call
+
+    Returns:
+        dict: {"result": answer} when no LLM call is needed ("I don't know." or an
+        extractive answer), otherwise {"messages", "sources"} for call_llm/stream_turn
+    """
+    best_score = max((score for _, score in docs_with_scores), default=None)
+    docs_with_scores = select_context(docs_with_scores)
+    if not docs_with_scores:
+        print(f"🤷 Best score {best_score} below {MIN_RELEVANCE}, answering without the LLM")
+        return {"result": {"answer": IDK_ANSWER, "sources": []}}
+    print(f"🎯 Using {len(docs_with_scores)} chunks (best score {best_score:.3f})")
+
+    if not history:
+        fast = answer_extractively(question, docs_with_scores)
+        if fast is not None:
+            return {"result": fast}
+
+    context = format_docs([doc for doc, _ in docs_with_scores])
+    return {"messages": build_messages(context, question, history), "sources": source_metadata(docs_with_scores)}
+
+def llm_gate(gate, plan: dict):
+    """The gate's context for plans that call the LLM; a no-op otherwise"""
+    if gate is None or "result" in plan:
+        return nullcontext()
+    return gate(plan["messages"])
+
+def call_llm(plan: dict) -> dict:
+    """Run the LLM call of a plan from plan_answer (plans that need no LLM return their result)"""
+    if "result" in plan:
+        return plan["result"]
+    print("🔄 Calling LLM...")
+    response = llm(plan["messages"])
+    
+    print(f"✅ Response generated successfully")
+    print(f"📏 Response length: {len(response) if response else 0} characters")
+    print(f"🔍 Response preview: {response[:100] if response else 'None'}...")
+    
+    if not response or response.strip() == "":
+        response = "I apologize, but I couldn't generate a response to your question. Please try rephrasing your question or try again."
+    
+    return {"answer": response, "sources": plan["sources"]}
+
+def answer_extractively(question: str, docs_with_scores):
+    """
+    Answer "What is X?" / "Which document defines Y?" with a sentence from the chunks, without the LLM
+
+    Returns:
+        dict: {"answer", "sources", "confidence", "mode"}, or None when the question
+        is not a definition/lookup or no sentence is confident enough
+    """
+    if not EXTRACTIVE_ENABLED:
+        return None
+    start = time.perf_counter()
+    result = extractive_answerer.answer(question, docs_with_scores)
+    if result is None:
+        return None
+    print(f"⚡ Extractive answer (confidence {result['confidence']}, {(time.perf_counter() - start) * 1000:.1f} ms)")
+    return {
+        "answer": result["answer"],
+        "sources": source_metadata([result["chunk"]]),
+        "confidence": result["confidence"],
+        "mode": "extractive",
+    }
+
+def source_metadata(docs_with_scores) -> list:
+    """Describe the retrieved chunks for API clients"""
+    return [
+        {
+            "source": source_name(doc.metadata),
+            "doc_type": doc_type_of(doc.metadata),
+            "score": round(float(score), 4),
+            "metadata": doc.metadata,
+        }
+        for doc, score in docs_with_scores
+    ]
+
+def list_sources(corpus=None) -> list:
+    """List the source documents that can be used as retrieval filters"""
+    if corpus not in (None, DEFAULT_CORPUS):
+        with corpus_registry.acquire(corpus) as active:
+            return describe_sources(active)
+    return describe_sources(index_handle.current)
+
+def describe_sources(active) -> list:
+    if active is None:
+        return []
+    if active.index is None:
+        return source_catalog(active.vectorstore).list_sources()
+    return active.index.list_sources()
+
 def create_rag_chain():
     """Create the RAG chain"""
     global rag_chain, prompt
@@ -165,28 +752,8 @@ Answer:
 """
     )
     
-    def build_messages(context, question):
-        return [
-            {"role": "system", "content": """You are an AI-powered policy assistant specialized in AI and Data Governance.
-Your role is to support users by interpreting and explaining governance frameworks, ethical standards, compliance guidelines, and policy definitions.
-
-Instructions:
-1. Base your answer only on the provided context.
-2. List the filenames of the documents you used (e.g., 'AI_Principles Document') under the "Sources" section.
-3. If the context does not contain the answer, respond with exactly: "I don't know."
-4. Do not make assumptions or add any information not explicitly stated in the context.
-
-Question: {question}
-
-Context: {context}
-
-Answer:"""},
-            *chat_history,  # ← this will hold prior conversation turns
-            {"role": "user", "content": f"{question}\n\nContext:\n{context}"}
-        ]
-
     rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
+        {"context": retriever | format_docs, "question": RunnablePassthrough()}
         | RunnableLambda(lambda inputs: llm(build_messages(inputs["context"], inputs["question"])))
         | StrOutputParser()
     ) 
@@ -210,17 +777,14 @@ Answer:"""},
     print("✅ RAG chain created successfully")
     return rag_chain
 
-def initialize_rag_system():
-    """Initialize the entire RAG system"""
+def initialize_rag_system(profile=None):
+    """Initialize the entire RAG system with a deployment profile (RAG_PROFILE, see engine.py)"""
     print("🚀 Initializing RAG System...")
     print("=" * 50)
     
     try:
-        # Initialize components in order
-        initialize_embeddings()
-        initialize_vectorstore()
-        initialize_llm()
-        create_rag_chain()
+        from engine import start_engine
+        start_engine(profile)
         
         print("=" * 50)
         print("✅ RAG System initialized successfully!")
@@ -231,43 +795,152 @@ def initialize_rag_system():
         print("=" * 50)
         return False
 
-def rag_chat(user_message: str) -> str:
+def rag_chat_with_sources(user_message: str, sources=None, doc_type=None, session_id=None, corpus=None, gate=None) -> dict:
     """
-    Main function to handle RAG chat requests
+    Handle a RAG chat request and return the answer together with its sources
     
     Args:
         user_message (str): The user's question
+        sources (list): Optional source filenames to restrict retrieval to
+        doc_type (str): Optional document type to restrict retrieval to
+        session_id (str): Optional conversation id; follow-ups are condensed using its history
+        corpus (str): Optional corpus name (defaults to the main chroma_db)
+        gate: Optional callable(messages) returning a context manager held around the LLM call only
         
     Returns:
-        str: The generated response
+        dict: {"answer": str, "sources": list}
     """
     try:
         if rag_chain is None:
-            return "❌ Error: RAG system not initialized. Please restart the server."
-        
-        print(f"🔍 Processing question: {user_message}")
-        print(f"📊 RAG chain initialized: {rag_chain is not None}")
-        print(f"📊 Retriever initialized: {retriever is not None}")
-        print(f"📊 LLM initialized: {llm is not None}")
-        
-        # Invoke the RAG chain
-        print("🔄 Invoking RAG chain...")
-        response = rag_chain.invoke(input=user_message)
+            return {"answer": "❌ Error: RAG system not initialized. Please restart the server.", "sources": []}
         
-        print(f"✅ Response generated successfully")
-        print(f"📏 Response length: {len(response) if response else 0} characters")
-        print(f"🔍 Response preview: {response[:100] if response else 'None'}...")
-        
-        if not response or response.strip() == "":
-            return "I apologize, but I couldn't generate a response to your question. Please try rephrasing your question or try again."
-        
-        return response
+        plan = plan_turn(user_message, sources, doc_type, session_id, corpus)
+        with llm_gate(gate, plan):
+            return complete_turn(plan)
         
     except Exception as e:
-        print(f"❌ Error in rag_chat: {e}")
-        print(f"🔍 Error type: {type(e).__name__}")
-        print(f"📊 Stack trace: {str(e)}")
-        return f"I apologize, but I encountered an error while processing your request: {str(e)}"
+        return error_result(e)
+
+def error_result(e: Exception) -> dict:
+    """The apology answer returned for errors while answering"""
+    print(f"❌ Error in rag_chat: {e}")
+    print(f"🔍 Error type: {type(e).__name__}")
+    print(f"📊 Stack trace: {str(e)}")
+    return {"answer": f"I apologize, but I encountered an error while processing your request: {str(e)}", "sources": []}
+
+def plan_turn(user_message: str, sources=None, doc_type=None, session_id=None, corpus=None) -> dict:
+    """
+    Everything in a chat turn before the LLM call (see prepare_turn and plan_answer)
+
+    Turns that need no LLM call (cached, "I don't know." or extractive answers) are
+    recorded right away and returned as {"result": answer}. Other plans carry what
+    complete_turn or stream_turn need, so callers can wait for an LLM slot in between.
+    """
+    history, answer_key, cached, docs_with_scores = prepare_turn(user_message, sources, doc_type, session_id, corpus)
+    if cached is not None:
+        return {"result": cached}
+    plan = plan_answer(user_message, docs_with_scores, history)
+    if "result" in plan:
+        finish_turn(session_id, user_message, plan["result"], answer_key)
+        return plan
+    plan.update(question=user_message, session_id=session_id, answer_key=answer_key)
+    return plan
+
+def complete_turn(plan: dict) -> dict:
+    """Call the LLM for a planned turn and record the answer"""
+    if "result" in plan:
+        return plan["result"]
+    result = call_llm(plan)
+    finish_turn(plan["session_id"], plan["question"], result, plan["answer_key"])
+    return result
+
+def prepare_turn(user_message: str, sources=None, doc_type=None, session_id=None, corpus=None):
+    """
+    Everything before the LLM call: history, follow-up condensation, answer cache and retrieval
+
+    Returns:
+        tuple: (history, answer cache key or None, cached result or None, retrieved (Document, score) pairs)
+    """
+    print(f"🔍 Processing question: {user_message}")
+    if sources or doc_type or corpus:
+        print(f"🗂️  Filters: corpus={corpus}, sources={sources}, doc_type={doc_type}")
+    
+    history = get_history(session_id)
+    retrieval_query = condense_question(user_message, history, session_id)
+    
+    # Answers without conversation history only depend on the question and filters
+    answer_key = None
+    if not history and ANSWER_CACHE_TTL > 0:
+        answer_key = cache_key("answer", user_message, sources, doc_type, corpus)
+        cached = state_store.get_json(answer_key)
+        if cached is not None:
+            print("⚡ Answer served from cache")
+            record_turn(session_id, user_message, cached["answer"])
+            return history, answer_key, cached, []
+    
+    docs_with_scores = cached_retrieve(retrieval_query, sources=sources, doc_type=doc_type, corpus=corpus)
+    print(f"📚 Retrieved {len(docs_with_scores)} chunks")
+    return history, answer_key, None, docs_with_scores
+
+def finish_turn(session_id, user_message: str, result: dict, answer_key=None):
+    """Cache a completed answer and append it to the session"""
+    if answer_key is not None:
+        state_store.set_json(answer_key, result, ANSWER_CACHE_TTL)
+    record_turn(session_id, user_message, result["answer"])
+
+def stream_chat(user_message: str, sources=None, doc_type=None, session_id=None, corpus=None, cancel=None, gate=None):
+    """
+    Streaming variant of rag_chat_with_sources
+    
+    Yields ("sources", list), then ("delta", str) chunks of the answer, then
+    ("done", {"answer", "sources"}). Setting the `cancel` event stops the
+    generation and closes the upstream LLM stream; a cancelled answer is
+    neither cached nor added to the session. Raises on errors.
+    """
+    if rag_chain is None:
+        raise RuntimeError("RAG system not initialized")
+    
+    plan = plan_turn(user_message, sources, doc_type, session_id, corpus)
+    with llm_gate(gate, plan):
+        yield from stream_turn(plan, cancel)
+
+def stream_turn(plan: dict, cancel=None):
+    """Stream the answer of a planned turn (see stream_chat for the events)"""
+    if "result" not in plan and cancel is not None and cancel.is_set():
+        return
+    if "result" in plan or llm_stream is None:
+        # Nothing to stream: cached, extractive or "I don't know." answers, or an LLM without streaming support
+        result = complete_turn(plan)
+        yield "sources", result["sources"]
+        yield "delta", result["answer"]
+        yield "done", result
+        return
+    
+    yield "sources", plan["sources"]
+    print(f"🔄 Streaming LLM answer ({len(plan['sources'])} chunks)...")
+    parts = []
+    for delta in llm_stream(plan["messages"], cancel):
+        parts.append(delta)
+        yield "delta", delta
+    if cancel is not None and cancel.is_set():
+        print("🛑 Answer cancelled by the client")
+        return
+    
+    result = {"answer": "".join(parts).strip(), "sources": plan["sources"]}
+    finish_turn(plan["session_id"], plan["question"], result, plan["answer_key"])
+    yield "done", result
+
+def rag_chat(user_message: str) -> str:
+    """
+    Main function to handle RAG chat requests
+    
+    Args:
+        user_message (str): The user's question
+        
+    Returns:
+        str: The generated response
+    """
+    return rag_chat_with_sources(user_message)["answer"]
 
 def test_rag_system():
     """Test the RAG system with a sample question"""
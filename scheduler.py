@@ -0,0 +1,345 @@
+"""
+Per-client quotas and fair scheduling of LLM calls.
+
+- Clients are identified by API key (X-API-Key); only configured keys get a
+  tier or weight. Everybody else is an anonymous per-IP client in the batch tier.
+- Each client has two fixed-window quotas: requests, and estimated tokens of
+  the LLM calls it actually makes. The counters live in the shared state store
+  (state_store.py), so every replica enforces the same quota. Requests over
+  quota are rejected with a retry-after delay.
+- LLM calls wait for one of a fixed number of slots in a weighted fair queue.
+  The interactive tier is always served before the batch tier. Within a tier,
+  clients are interleaved by virtual finish time, so a client with a deep
+  backlog cannot starve the others.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from state_store import InMemoryStateStore, StateStore
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+TIER_RANK = {INTERACTIVE: 0, BATCH: 1}
+
+# Answer budget added to the prompt size of an LLM call
+ANSWER_TOKENS_ESTIMATE = 512
+
+
+class QuotaExceeded(Exception):
+    """Raised when a client is over its request or token quota"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UnknownAPIKey(Exception):
+    """Raised for an API key that is not configured"""
+
+
+def estimate_tokens(messages: list) -> int:
+    """Estimate the tokens of an LLM call from its chat messages (about 4 characters per token)"""
+    return sum(len(message["content"]) for message in messages) // 4 + ANSWER_TOKENS_ESTIMATE
+
+
+class ClientIdentity:
+    """Who is calling, which tier they belong to and their share within it"""
+
+    def __init__(self, client_id: str, tier: str = BATCH, weight: float = 1.0):
+        self.client_id = client_id
+        self.tier = tier
+        self.weight = weight
+
+    def as_tier(self, tier: str) -> "ClientIdentity":
+        return ClientIdentity(self.client_id, tier, self.weight)
+
+    def to_dict(self) -> dict:
+        return {"client_id": self.client_id, "tier": self.tier, "weight": self.weight}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ClientIdentity":
+        return cls(data["client_id"], data.get("tier", BATCH), data.get("weight", 1.0))
+
+
+def identify_client(headers, remote_host: Optional[str], api_keys: Dict[str, str],
+                    client_tiers: Dict[str, str], client_weights: Dict[str, float],
+                    require_api_key: bool = False, default_tier: str = BATCH) -> ClientIdentity:
+    """
+    Identify the caller of a request
+
+    `api_keys` maps keys to client names; only those clients get their configured
+    tier and weight. Callers without a configured key share one quota per remote
+    address in `default_tier` (refused with `require_api_key`). Self-declared
+    names are not trusted, so they cannot buy priority or fresh quotas.
+    """
+    api_key = headers.get("x-api-key")
+    if api_key and api_keys:
+        if api_key not in api_keys:
+            raise UnknownAPIKey("Unknown API key")
+        client_id = api_keys[api_key]
+        tier = client_tiers.get(client_id, default_tier)
+        if tier not in TIER_RANK:
+            tier = default_tier
+        return ClientIdentity(client_id, tier, float(client_weights.get(client_id, 1.0)))
+    if require_api_key:
+        raise UnknownAPIKey("An API key is required (X-API-Key)")
+    return ClientIdentity(f"ip:{remote_host or 'unknown'}", default_tier)
+
+
+class ClientStats:
+    """Usage and throttling counters of one client"""
+
+    def __init__(self, identity: ClientIdentity):
+        self.tier = identity.tier
+        self.requests = 0
+        self.estimated_tokens = 0
+        self.throttled = 0
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+        self.recent_waits = deque(maxlen=256)
+        self.last_seen = time.time()
+
+    def to_dict(self) -> dict:
+        waits = sorted(self.recent_waits)
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else None
+
+        return {
+            "tier": self.tier,
+            "requests": self.requests,
+            "estimated_tokens": self.estimated_tokens,
+            "throttled": self.throttled,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_seconds_total": round(self.wait_seconds, 3),
+            "last_seen": self.last_seen,
+        }
+
+
+class _Waiter:
+    def __init__(self, identity: ClientIdentity, wake):
+        self.identity = identity
+        self.wake = wake
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+
+
+class FairScheduler:
+    """Per-client quotas in a shared store plus a weighted fair queue in front of `slots` concurrent LLM calls"""
+
+    def __init__(self, slots: int, requests_per_window: int, tokens_per_window: int, window: float = 60.0,
+                 store: Optional[StateStore] = None, max_clients: int = 10000):
+        self.slots = max(1, slots)
+        self.requests_per_window = requests_per_window
+        self.tokens_per_window = tokens_per_window
+        self.window = window
+        self.store = store or InMemoryStateStore()  # replaced by the shared store once the engine starts
+        self.max_clients = max_clients
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._clients = {}  # client_id -> ClientStats (this replica's view)
+        self._queues = {tier: [] for tier in TIER_RANK}  # heaps of (finish tag, sequence, waiter)
+        self._virtual_time = {tier: 0.0 for tier in TIER_RANK}
+        self._last_finish = {}  # (tier, client_id) -> finish tag of its latest request
+        self._sequence = itertools.count()
+
+    # --- Quotas -----------------------------------------------------------------
+
+    def admit(self, identity: ClientIdentity, tokens: int = 0, requests: int = 1):
+        """
+        Charge a client's quotas, raising QuotaExceeded (with a retry-after) when over
+
+        Requests are charged per API call and tokens per LLM call. Rejected
+        requests still count (so hammering does not pay off); rejected tokens
+        are given back.
+        """
+        if tokens > self.tokens_per_window:
+            self._throttled(identity)
+            raise QuotaExceeded(f"LLM call too large for client '{identity.client_id}' quota", float("inf"))
+        now = time.time()
+        retry_after = self.window - now % self.window
+        if requests and self.store.count_in_window(f"{identity.client_id}:requests", self.window, requests, at=now) > self.requests_per_window:
+            self._throttled(identity)
+            raise QuotaExceeded(f"Request quota exceeded for client '{identity.client_id}'", retry_after)
+        if tokens and self.store.count_in_window(f"{identity.client_id}:tokens", self.window, tokens, at=now) > self.tokens_per_window:
+            self.store.count_in_window(f"{identity.client_id}:tokens", self.window, -tokens, at=now)  # same window as the charge
+            self._throttled(identity)
+            raise QuotaExceeded(f"Token quota exceeded for client '{identity.client_id}'", retry_after)
+        with self._lock:
+            stats = self._stats(identity)
+            stats.last_seen = time.time()
+            stats.requests += requests
+            stats.estimated_tokens += tokens
+
+    async def admit_async(self, identity: ClientIdentity, tokens: int = 0, requests: int = 1):
+        """admit() without blocking the event loop on a network store"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.admit, identity, tokens, requests)
+
+    def _throttled(self, identity: ClientIdentity):
+        with self._lock:
+            stats = self._stats(identity)
+            stats.last_seen = time.time()
+            stats.throttled += 1
+
+    async def wait_for_quota_async(self, identity: ClientIdentity, tokens: int):
+        """Charge an LLM call's tokens, waiting until the quota allows it (for the event loop)"""
+        while True:
+            try:
+                return await self.admit_async(identity, tokens, requests=0)
+            except QuotaExceeded as e:
+                if e.retry_after == float("inf"):
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    def _stats(self, identity: ClientIdentity) -> ClientStats:
+        stats = self._clients.get(identity.client_id)
+        if stats is None:
+            if len(self._clients) >= self.max_clients:
+                self._forget_idle_client()
+            stats = self._clients[identity.client_id] = ClientStats(identity)
+        return stats
+
+    def _forget_idle_client(self):
+        idle = [cid for cid, s in self._clients.items() if s.queued == 0 and s.running == 0]
+        if idle:
+            oldest = min(idle, key=lambda cid: self._clients[cid].last_seen)
+            del self._clients[oldest]
+            for tier in TIER_RANK:
+                self._last_finish.pop((tier, oldest), None)
+
+    # --- Fair queue -------------------------------------------------------------
+
+    def _enqueue(self, identity: ClientIdentity, cost: float, wake) -> _Waiter:
+        waiter = _Waiter(identity, wake)
+        with self._lock:
+            stats = self._stats(identity)
+            stats.queued += 1
+            key = (identity.tier, identity.client_id)
+            start = max(self._virtual_time[identity.tier], self._last_finish.get(key, 0.0))
+            finish = start + cost / max(identity.weight, 1e-6)
+            self._last_finish[key] = finish
+            heapq.heappush(self._queues[identity.tier], (finish, next(self._sequence), waiter))
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self):
+        """Hand free slots to the next waiters: interactive first, then by finish tag (lock must be held)"""
+        while self.in_use < self.slots:
+            waiter = None
+            for tier in sorted(TIER_RANK, key=TIER_RANK.get):
+                queue = self._queues[tier]
+                while queue:
+                    finish, _, candidate = heapq.heappop(queue)
+                    if not candidate.cancelled:
+                        self._virtual_time[tier] = finish
+                        waiter = candidate
+                        break
+                if waiter is not None:
+                    break
+            if waiter is None:
+                return
+            self.in_use += 1
+            waiter.granted = True
+            stats = self._clients.get(waiter.identity.client_id)
+            if stats is not None:
+                waited = time.monotonic() - waiter.enqueued_at
+                stats.queued -= 1
+                stats.running += 1
+                stats.wait_seconds += waited
+                stats.recent_waits.append(waited)
+            waiter.wake()
+
+    def _cancel(self, waiter: _Waiter):
+        with self._lock:
+            if not (waiter.granted or waiter.cancelled):
+                waiter.cancelled = True
+                stats = self._clients.get(waiter.identity.client_id)
+                if stats is not None:
+                    stats.queued -= 1
+
+    def release(self, identity: ClientIdentity):
+        with self._lock:
+            self.in_use -= 1
+            stats = self._clients.get(identity.client_id)
+            if stats is not None:
+                stats.running -= 1
+                stats.completed += 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, identity: ClientIdentity, cost: float):
+        """Hold an LLM slot (blocking; for worker threads)"""
+        granted = threading.Event()
+        self._enqueue(identity, cost, granted.set)
+        granted.wait()
+        try:
+            yield
+        finally:
+            self.release(identity)
+
+    @asynccontextmanager
+    async def slot_async(self, identity: ClientIdentity, cost: float):
+        """Hold an LLM slot (for the event loop); a caller that goes away leaves the queue"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            if future.cancelled():
+                self.release(identity)  # the caller left between dispatch and wake-up
+            else:
+                future.set_result(True)
+
+        waiter = self._enqueue(identity, cost, lambda: loop.call_soon_threadsafe(grant))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(identity)  # granted just before the caller left
+            else:
+                self._cancel(waiter)  # still queued, or grant() releases the slot
+            raise
+        try:
+            yield
+        finally:
+            self.release(identity)
+
+    # --- Metrics ----------------------------------------------------------------
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "in_use": self.in_use,
+                "queued": {tier: sum(1 for *_, w in queue if not w.cancelled) for tier, queue in self._queues.items()},
+                "quotas": {
+                    "window_seconds": self.window,
+                    "requests_per_window": self.requests_per_window,
+                    "tokens_per_window": self.tokens_per_window,
+                    "store": self.store.stats().get("backend"),
+                },
+                "clients": {client_id: stats.to_dict() for client_id, stats in self._clients.items()},
+            }
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "in_use": self.in_use,
+                "queued": sum(1 for queue in self._queues.values() for *_, w in queue if not w.cancelled),
+                "clients": len(self._clients),
+            }
@@ -0,0 +1,145 @@
+"""
+Warm-restart snapshots of the initialized RAG engine.
+
+A snapshot stores the partitioned index (embeddings as a .npy file that is
+memory-mapped back on boot), the chunk texts and metadata, and hot caches.
+It is tied to a fingerprint of the `chroma_db` directory and is ignored as
+soon as the vector store changes.
+
+Layout:
+    snapshots/
+        embedder-<model>/            saved sentence-transformers model
+        v1-<fingerprint>/
+            manifest.json
+            embeddings.npy
+            rows.json
+            caches.json
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+
+from partitions import PartitionedIndex
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# SQLite journal and lock files change without the stored data changing
+VOLATILE_SUFFIXES = ("-wal", "-shm", "-journal", ".lock")
+
+
+def chroma_fingerprint(chroma_path: str = "chroma_db") -> str:
+    """Fingerprint the vector store files (path, size and modification time)"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(chroma_path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(VOLATILE_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, chroma_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def snapshot_path(snapshot_dir: str, fingerprint: str) -> str:
+    return os.path.join(snapshot_dir, f"v{SNAPSHOT_FORMAT_VERSION}-{fingerprint[:16]}")
+
+
+def embedder_path(snapshot_dir: str, model_name: str) -> str:
+    return os.path.join(snapshot_dir, "embedder-" + model_name.replace("/", "--"))
+
+
+def save_embedder(snapshot_dir: str, model_name: str, embedding_model) -> str:
+    """Save the embedding model locally so later boots skip the Hugging Face Hub"""
+    path = embedder_path(snapshot_dir, model_name)
+    if os.path.exists(os.path.join(path, "modules.json")):
+        return path
+    client = getattr(embedding_model, "client", None)
+    if client is None or not hasattr(client, "save"):
+        return None
+    client.save(path)
+    return path
+
+
+def save_snapshot(snapshot_dir: str, fingerprint: str, index: PartitionedIndex, embedder_name: str, caches: dict) -> str:
+    """
+    Write a snapshot of the index loaded from the chroma_db version with this fingerprint
+
+    The fingerprint must be the one taken when the index was loaded, not the
+    current files: chroma_db may have been replaced since then. The snapshot is
+    written to a temporary directory and renamed into place, so a crash
+    mid-write never leaves a half-written snapshot behind.
+    """
+    target = snapshot_path(snapshot_dir, fingerprint)
+    staging = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+
+    np.save(os.path.join(staging, "embeddings.npy"), np.ascontiguousarray(index.embeddings, dtype=np.float32))
+    with open(os.path.join(staging, "rows.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": index.ids, "documents": index.documents, "metadatas": index.metadatas}, f)
+    with open(os.path.join(staging, "caches.json"), "w", encoding="utf-8") as f:
+        json.dump(caches, f)
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "chroma_fingerprint": fingerprint,
+            "embedder": embedder_name,
+            "chunks": len(index),
+            "created_at": time.time(),
+        }, f, indent=2)
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    return target
+
+
+def load_snapshot(snapshot_dir: str, fingerprint: str, embedder_name: str):
+    """
+    Load the snapshot matching a chroma_db fingerprint, or None if there is no valid one
+
+    Returns:
+        tuple: (PartitionedIndex with memory-mapped embeddings, caches dict)
+    """
+    path = snapshot_path(snapshot_dir, fingerprint)
+    manifest_file = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_file):
+        return None
+
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        return None
+    if manifest.get("chroma_fingerprint") != fingerprint or manifest.get("embedder") != embedder_name:
+        return None
+
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    with open(os.path.join(path, "rows.json"), "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    if len(rows["ids"]) != embeddings.shape[0]:
+        return None
+
+    caches = {}
+    caches_file = os.path.join(path, "caches.json")
+    if os.path.exists(caches_file):
+        with open(caches_file, "r", encoding="utf-8") as f:
+            caches = json.load(f)
+
+    index = PartitionedIndex.from_arrays(rows["ids"], embeddings, rows["documents"], rows["metadatas"])
+    return index, caches
+
+
+def prune_snapshots(snapshot_dir: str, keep: str):
+    """Delete snapshots of older chroma_db versions"""
+    if not os.path.isdir(snapshot_dir):
+        return
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        if re.match(r"^v\d+-", name) and path != keep:
+            shutil.rmtree(path, ignore_errors=True)
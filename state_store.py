@@ -0,0 +1,383 @@
+"""
+Pluggable shared state for running several API replicas.
+
+Sessions, answer/retrieval caches and rate-limit counters go through a
+`StateStore`:
+
+- `InMemoryStateStore`: single process (the default)
+- `RedisStateStore`: any server speaking the Redis protocol (RESP), so all
+  replicas behind a load balancer share the same state
+- `CachedStateStore`: a client-side near cache in front of a network store,
+  so hot cache reads do not cost a round trip every time
+
+`create_state_store("redis://host:6379/0")` picks the implementation from a
+URL. `python state_store.py --serve 6379` starts a small Redis-protocol
+stand-in (backed by `InMemoryStateStore`) for local testing.
+"""
+
+import json
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+from urllib.parse import urlparse
+
+
+class StateStore:
+    """Key/value interface shared by all backends (values are str)"""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter; `ttl` is applied when the counter is created"""
+        raise NotImplementedError
+
+    def count_in_window(self, name: str, window: float, amount: int = 1, at: Optional[float] = None) -> int:
+        """
+        Rate-limit counter: add `amount` to the fixed window of `name` and return its total
+
+        The window is the current one, or the one containing the timestamp `at`
+        (so a refund lands in the window that was charged).
+        """
+        bucket = int((time.time() if at is None else at) // window)
+        return self.incr(f"ratelimit:{name}:{bucket}", amount, ttl=window * 2)
+
+    def get_json(self, key: str, default=None):
+        value = self.get(key)
+        return default if value is None else json.loads(value)
+
+    def set_json(self, key: str, value, ttl: Optional[float] = None):
+        self.set(key, json.dumps(value, separators=(",", ":")), ttl)
+
+    def stats(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class InMemoryStateStore(StateStore):
+    """Process-local store with per-key expiry and an LRU bound on the number of keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()  # key -> (value, expires_at or None)
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return None if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                value, expires_at = amount, (time.time() + ttl if ttl else None)
+            else:
+                value, expires_at = int(entry[0]) + amount, entry[1]
+            self._data[key] = (str(value), expires_at)
+            return value
+
+    def ttl(self, key) -> Optional[float]:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None or entry[1] is None:
+                return None
+            return entry[1] - time.time()
+
+    def stats(self):
+        return {"backend": "memory", "keys": len(self._data)}
+
+
+class RedisProtocolError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisStateStore(StateStore):
+    """Minimal Redis (RESP2) client; one persistent connection per thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+        self.round_trips = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            if self.db:
+                self._command_on(conn, "SELECT", self.db)
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn[0].close()
+            finally:
+                self._local.conn = None
+
+    def command(self, *args):
+        """Send one command and return its decoded reply (reconnects once on a dropped connection)"""
+        for attempt in (1, 2):
+            try:
+                return self._command_on(self._connection(), *args)
+            except (ConnectionError, socket.timeout, OSError):
+                self._close()
+                if attempt == 2:
+                    raise
+
+    def _command_on(self, conn, *args):
+        sock, reader = conn
+        sock.sendall(encode_command(args))
+        self.round_trips += 1
+        return read_reply(reader)
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self.command("SET", key, value)
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def incr(self, key, amount=1, ttl=None):
+        value = int(self.command("INCRBY", key, amount))
+        if ttl and value == amount:
+            self.command("PEXPIRE", key, int(ttl * 1000))
+        return value
+
+    def ping(self) -> bool:
+        return self.command("PING") == "PONG"
+
+    def stats(self):
+        return {"backend": "redis", "host": self.host, "port": self.port, "round_trips": self.round_trips}
+
+
+class CachedStateStore(StateStore):
+    """
+    Client-side near cache in front of a network store
+
+    Reads of keys under `cached_prefixes` (immutable-ish caches such as answers
+    and retrievals) are served locally for up to `ttl` seconds. Everything else
+    (sessions, counters) always goes to the backend so replicas stay consistent.
+    """
+
+    def __init__(self, backend: StateStore, ttl: float = 5.0, max_entries: int = 10000,
+                 cached_prefixes: Sequence[str] = ("answer:", "retrieval:")):
+        self.backend = backend
+        self.ttl = ttl
+        self.cached_prefixes = tuple(cached_prefixes)
+        self._near = InMemoryStateStore(max_keys=max_entries)
+        self.near_hits = 0
+        self.near_misses = 0
+
+    def _cacheable(self, key: str) -> bool:
+        return key.startswith(self.cached_prefixes)
+
+    def get(self, key):
+        if not self._cacheable(key):
+            return self.backend.get(key)
+        value = self._near.get(key)
+        if value is not None:
+            self.near_hits += 1
+            return value
+        self.near_misses += 1
+        value = self.backend.get(key)
+        if value is not None:
+            self._near.set(key, value, self.ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+        if self._cacheable(key):
+            self._near.set(key, value, min(self.ttl, ttl) if ttl else self.ttl)
+
+    def delete(self, key):
+        self._near.delete(key)
+        self.backend.delete(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.backend.incr(key, amount, ttl)
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats.update({"near_cache_hits": self.near_hits, "near_cache_misses": self.near_misses})
+        return stats
+
+
+def create_state_store(url: Optional[str] = None, near_cache_ttl: float = 5.0, max_keys: int = 100000) -> StateStore:
+    """Build a store from a URL: memory:// (default) or redis://host:port/db"""
+    if not url or url.startswith("memory://"):
+        return InMemoryStateStore(max_keys=max_keys)
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Unsupported state store URL: {url}")
+    db = int(parsed.path.lstrip("/") or 0)
+    backend = RedisStateStore(parsed.hostname or "127.0.0.1", parsed.port or 6379, db)
+    if near_cache_ttl > 0:
+        return CachedStateStore(backend, ttl=near_cache_ttl)
+    return backend
+
+
+# --- RESP encoding ---------------------------------------------------------------
+
+def encode_command(args) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode()
+    if prefix == b"-":
+        raise RedisProtocolError(payload.decode())
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)[:-2]
+        return data.decode("utf-8")
+    if prefix == b"*":
+        count = int(payload)
+        return None if count < 0 else [read_reply(reader) for _ in range(count)]
+    raise RedisProtocolError(f"Unexpected reply: {line!r}")
+
+
+# --- Redis-protocol stand-in (for tests and local development) -------------------
+
+class _RESPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                args = read_reply(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            if not isinstance(args, list) or not args:
+                return
+            try:
+                reply = self.execute(store, [str(a) for a in args])
+            except Exception as e:
+                reply = RedisProtocolError(str(e))
+            self.wfile.write(_encode_reply(reply))
+
+    @staticmethod
+    def execute(store: InMemoryStateStore, args):
+        command = args[0].upper()
+        if command == "PING":
+            return "+PONG"
+        if command == "SELECT":
+            return "+OK"
+        if command == "GET":
+            return store.get(args[1])
+        if command == "SET":
+            ttl = None
+            if len(args) >= 5 and args[3].upper() in ("EX", "PX"):
+                ttl = float(args[4]) / (1000 if args[3].upper() == "PX" else 1)
+            store.set(args[1], args[2], ttl)
+            return "+OK"
+        if command == "DEL":
+            for key in args[1:]:
+                store.delete(key)
+            return len(args) - 1
+        if command in ("INCR", "INCRBY"):
+            return store.incr(args[1], int(args[2]) if len(args) > 2 else 1)
+        if command in ("EXPIRE", "PEXPIRE"):
+            value = store.get(args[1])
+            if value is None:
+                return 0
+            store.set(args[1], value, float(args[2]) / (1000 if command == "PEXPIRE" else 1))
+            return 1
+        raise RedisProtocolError(f"ERR unknown command '{args[0]}'")
+
+
+def _encode_reply(reply) -> bytes:
+    if isinstance(reply, RedisProtocolError):
+        return f"-{reply}\r\n".encode()
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, str) and reply.startswith("+"):
+        return f"{reply}\r\n".encode()
+    data = str(reply).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    """Tiny Redis-protocol server backed by InMemoryStateStore"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _RESPHandler)
+        self.store = InMemoryStateStore()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "RESPServer":
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Redis-protocol stand-in server")
+    parser.add_argument("--serve", type=int, default=6379, metavar="PORT")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    server = RESPServer(args.host, args.serve)
+    print(f"🗄️  Redis-protocol stand-in listening on {args.host}:{server.port}")
+    server.serve_forever()
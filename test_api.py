@@ -37,6 +37,21 @@ def test_api():
         print(f"Response: {json.dumps(response.json(), indent=2)}")
     except Exception as e:
         print(f"❌ Legacy chat endpoint failed: {e}")
+    
+    # Test batch chat endpoint (NDJSON stream)
+    print("\n4. Testing batch chat endpoint...")
+    try:
+        response = requests.post(
+            "http://localhost:8000/chat/batch",
+            json={"questions": ["What is AI governance?", "What is data governance?"]},
+            stream=True
+        )
+        print(f"Status: {response.status_code}")
+        for line in response.iter_lines():
+            if line:
+                print(f"Item: {json.dumps(json.loads(line), indent=2)}")
+    except Exception as e:
+        print(f"❌ Batch chat endpoint failed: {e}")
 
 if __name__ == "__main__":
     test_api()
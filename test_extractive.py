@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from extractive import ExtractiveAnswerer, classify_question, definition_cue
+
+def chunk(text, source="/docs/AI_Principles.pdf", score=0.75):
+    return Document(page_content=text, metadata={"source": source}), score
+
+def test_classify_question():
+    print("\n🧪 Testing question classification...")
+    assert classify_question("What is GDPR?") == ("definition", "GDPR")
+    assert classify_question("What does DPIA stand for?") == ("definition", "DPIA")
+    assert classify_question("Define data minimization") == ("definition", "data minimization")
+    assert classify_question("Which document defines high-risk AI?") == ("lookup", "high-risk AI")
+    assert classify_question("What is the difference between GDPR and the AI Act?") is None
+    assert classify_question("How do I report an incident?") is None
+    print("✅ Question classification passed")
+
+def test_definition_scoring():
+    print("\n🧪 Testing definition scoring...")
+    assert definition_cue("GDPR is the EU regulation on data protection.", "GDPR") == 0.9
+    assert definition_cue("Personal data is defined as any information about a person.", "Personal data") == 1.0
+    assert definition_cue("Under GDPR, personal data means any information relating to a person.", "GDPR") == 0.6
+    assert definition_cue("GDPR applies to every controller.", "GDPR") == 0.0
+
+    answerer = ExtractiveAnswerer()
+    # The term is not the subject: the LLM must answer
+    weak = [chunk("Under GDPR, personal data means any information relating to an identified person.", score=0.95)]
+    assert answerer.answer("What is GDPR?", weak) is None
+
+    strong = [chunk("The General Data Protection Regulation (GDPR) is the EU law on data protection and privacy.")]
+    result = answerer.answer("What is GDPR?", strong)
+    assert result is not None and result["confidence"] >= 0.6, result
+    assert result["answer"].endswith("Sources:\n- AI_Principles.pdf")
+    assert answerer.answer("Why does GDPR exist?", strong) is None
+    print("✅ Definition scoring passed")
+
+if __name__ == "__main__":
+    test_classify_question()
+    test_definition_scoring()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from jobs import FAILED, QUEUED, SUCCEEDED, JobManager, JobQueueFull, RetryLater
+
+def check_results_survive_backlog():
+    print("\n🧪 Testing result retention under a backlog...")
+    release = threading.Event()
+
+    def handler(payload):
+        if payload.get("block"):
+            release.wait(5)
+        if payload.get("fail"):
+            raise ValueError("bad question")
+        return {"answer": payload["question"]}
+
+    manager = JobManager(handler, workers=1, max_pending=20, max_results=5)
+    manager.start()
+    try:
+        first = manager.submit({"question": "first"})
+        assert first.done.wait(5)
+        blocker = manager.submit({"question": "blocker", "block": True})
+        backlog = [manager.submit({"question": f"q{i}"}) for i in range(9)]
+
+        # The finished result is still there although the backlog exceeds max_results
+        job = manager.get(first.id)
+        assert job is not None and job.status == SUCCEEDED and job.result == {"answer": "first"}
+        assert manager.stats()["queued"] == 9
+
+        release.set()
+        for job in [blocker] + backlog:
+            assert job.done.wait(5)
+        # Once everything has finished, only the newest max_results results are kept
+        manager.submit({"question": "last"}).done.wait(5)
+        assert manager.get(first.id) is None
+        assert manager.stats()["stored"] <= 6
+
+        failed = manager.submit({"question": "x", "fail": True})
+        assert failed.done.wait(5)
+        assert manager.get(failed.id).to_dict()["error"] == "bad question"
+        assert manager.get(failed.id).status == FAILED
+    finally:
+        manager.stop()
+    print("✅ Result retention passed")
+
+def check_queue_limit():
+    print("\n🧪 Testing the pending-job limit...")
+    manager = JobManager(lambda payload: {}, workers=1, max_pending=2)  # not started: jobs stay queued
+    manager.submit({})
+    manager.submit({})
+    try:
+        manager.submit({})
+        raise AssertionError("expected JobQueueFull")
+    except JobQueueFull:
+        pass
+    assert manager.stats()["queued"] == 2 and all(job.status == QUEUED for job in manager._jobs.values())
+    print("✅ Pending-job limit passed")
+
+def check_retry_later():
+    print("\n🧪 Testing deferred jobs...")
+    attempts = []
+    order = []
+
+    def handler(payload):
+        attempts.append(payload["name"])
+        if payload["name"] == "over-quota" and attempts.count("over-quota") == 1:
+            raise RetryLater(0.2, "quota exceeded")
+        order.append(payload["name"])
+        return {"answer": payload["name"]}
+
+    manager = JobManager(handler, workers=1)
+    manager.start()
+    try:
+        deferred = manager.submit({"name": "over-quota"}, client="a")
+        time.sleep(0.05)
+        assert deferred.status == QUEUED and manager.stats()["deferred"] == 1
+        # The single worker is free for other clients while the deferred job waits
+        other = manager.submit({"name": "other"}, client="b")
+        assert other.done.wait(0.15) and not deferred.finished
+        assert deferred.done.wait(5) and deferred.result == {"answer": "over-quota"}
+        assert order == ["other", "over-quota"] and manager.stats()["retries"] == 1
+    finally:
+        manager.stop()
+    print("✅ Deferred jobs passed")
+
+def test_jobs():
+    check_results_survive_backlog()
+    check_queue_limit()
+    check_retry_later()
+
+if __name__ == "__main__":
+    test_jobs()
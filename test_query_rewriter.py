@@ -0,0 +1,42 @@
+from query_rewriter import QueryRewriter, is_standalone, rule_based_rewrite
+
+HISTORY = [
+    {"role": "user", "content": "What is the EU AI Act?"},
+    {"role": "assistant", "content": "The EU AI Act is a regulation..."},
+]
+
+def test_standalone_questions_pass_through():
+    print("\n🧪 Testing standalone questions...")
+    rewriter = QueryRewriter()
+    for question in [
+        "What are the obligations that apply to providers of high-risk systems?",
+        "Are there fines for breaches under GDPR?",
+        "Define GDPR",
+        "Which document covers these requirements for data retention?",
+        "Why does GDPR require a data protection officer?",
+    ]:
+        assert is_standalone(question), question
+        assert rewriter.rewrite(question, HISTORY) == question
+    print("✅ Standalone questions passed")
+
+def test_follow_ups_are_resolved():
+    print("\n🧪 Testing follow-up resolution...")
+    rewriter = QueryRewriter()
+    cases = {
+        "What are its penalties?": "What are the EU AI Act's penalties?",
+        "What does that mean?": "What does the EU AI Act mean?",
+        "Who enforces it?": "Who enforces the EU AI Act?",
+        "what about its penalties?": "the EU AI Act's penalties?",
+        "What about GDPR?": "What is GDPR?",
+        "Why?": "Why (the EU AI Act)?",
+    }
+    for question, expected in cases.items():
+        assert not is_standalone(question), question
+        assert rewriter.rewrite(question, HISTORY) == expected, (question, rewriter.rewrite(question, HISTORY))
+    assert rule_based_rewrite("Is that mandatory for the obligations that apply?", "What is the EU AI Act?") == \
+        "Is the EU AI Act mandatory for the obligations that apply?"
+    print("✅ Follow-up resolution passed")
+
+if __name__ == "__main__":
+    test_standalone_questions_pass_through()
+    test_follow_ups_are_resolved()
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+from jobs import JobManager
+from scheduler import BATCH, INTERACTIVE, ClientIdentity, FairScheduler, QuotaExceeded, UnknownAPIKey, identify_client
+from state_store import InMemoryStateStore
+
+API_KEYS = {"ui-key": "chainlit-ui", "team-key": "reports-team"}
+TIERS = {"chainlit-ui": INTERACTIVE}
+WEIGHTS = {"reports-team": 2}
+
+def check_identity():
+    print("\n🧪 Testing client identification...")
+    ui = identify_client({"x-api-key": "ui-key"}, "10.0.0.1", API_KEYS, TIERS, WEIGHTS)
+    assert (ui.client_id, ui.tier, ui.weight) == ("chainlit-ui", INTERACTIVE, 1.0)
+    team = identify_client({"x-api-key": "team-key"}, "10.0.0.1", API_KEYS, TIERS, WEIGHTS)
+    assert (team.client_id, team.tier, team.weight) == ("reports-team", BATCH, 2.0)
+
+    # Self-declared names buy neither a tier nor a fresh quota
+    spoofed = identify_client({"x-client-id": "chainlit-ui"}, "10.0.0.2", API_KEYS, TIERS, WEIGHTS)
+    renamed = identify_client({"x-client-id": "someone-else"}, "10.0.0.2", API_KEYS, TIERS, WEIGHTS)
+    assert (spoofed.client_id, spoofed.tier) == ("ip:10.0.0.2", BATCH)
+    assert renamed.client_id == spoofed.client_id
+
+    for headers, require in (({"x-api-key": "stolen"}, False), ({}, True)):
+        try:
+            identify_client(headers, "10.0.0.3", API_KEYS, TIERS, WEIGHTS, require_api_key=require)
+            raise AssertionError("expected UnknownAPIKey")
+        except UnknownAPIKey:
+            pass
+    print("✅ Client identification passed")
+
+def check_quotas():
+    print("\n🧪 Testing shared quotas...")
+    store = InMemoryStateStore()
+    replica_a = FairScheduler(1, requests_per_window=3, tokens_per_window=1000, store=store)
+    replica_b = FairScheduler(1, requests_per_window=3, tokens_per_window=1000, store=store)
+    client = ClientIdentity("reports-team")
+
+    # Both replicas count against one quota
+    replica_a.admit(client)
+    replica_b.admit(client)
+    replica_a.admit(client)
+    try:
+        replica_b.admit(client)
+        raise AssertionError("expected QuotaExceeded")
+    except QuotaExceeded as e:
+        assert 0 < e.retry_after <= 60
+
+    # Rejected tokens are given back, calls larger than the whole quota can never run
+    replica_a.admit(client, tokens=800, requests=0)
+    try:
+        replica_b.admit(client, tokens=300, requests=0)
+        raise AssertionError("expected QuotaExceeded")
+    except QuotaExceeded:
+        pass
+    replica_b.admit(client, tokens=200, requests=0)
+    try:
+        replica_a.admit(ClientIdentity("other"), tokens=1001, requests=0)
+        raise AssertionError("expected QuotaExceeded")
+    except QuotaExceeded as e:
+        assert e.retry_after == float("inf")
+    assert replica_b.metrics()["clients"]["reports-team"]["throttled"] == 2  # usage stats stay per replica
+
+    # A refund lands in the window that was charged, even when the clock rolls over in between
+    real_time, real_count = time.time, store.count_in_window
+    boundary = (real_time() // 60 + 1) * 60
+    clock = [boundary - 1]
+
+    def count_then_roll_over(name, window, amount=1, at=None):
+        total = real_count(name, window, amount, at)
+        if amount > 0:
+            clock[0] = boundary + 1  # the next window starts right after the charge
+        return total
+
+    time.time = lambda: clock[0]
+    store.count_in_window = count_then_roll_over
+    try:
+        late = ClientIdentity("late")
+        replica_a.admit(late, tokens=900, requests=0)
+        clock[0] = boundary - 1
+        try:
+            replica_a.admit(late, tokens=900, requests=0)
+            raise AssertionError("expected QuotaExceeded")
+        except QuotaExceeded:
+            pass
+    finally:
+        time.time, store.count_in_window = real_time, real_count
+    assert store.count_in_window("late:tokens", 60, 0, at=boundary - 1) == 900
+    assert store.count_in_window("late:tokens", 60, 0, at=boundary + 1) == 0
+    print("✅ Shared quotas passed")
+
+def check_fair_queue():
+    print("\n🧪 Testing the weighted fair queue...")
+
+    async def run():
+        scheduler = FairScheduler(1, requests_per_window=100, tokens_per_window=10000)
+        order = []
+
+        async def call(name, identity):
+            async with scheduler.slot_async(identity, 100):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        first = asyncio.create_task(call("first", ClientIdentity("a")))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(call(f"a{i}", ClientIdentity("a"))) for i in range(3)]
+        tasks += [asyncio.create_task(call(f"b{i}", ClientIdentity("b"))) for i in range(2)]
+        tasks.append(asyncio.create_task(call("ui", ClientIdentity("chainlit-ui", INTERACTIVE))))
+        await asyncio.gather(first, *tasks)
+        assert order == ["first", "ui", "a0", "b0", "a1", "b1", "a2"], order
+
+        # A caller that leaves the queue gives up its place without leaking the slot
+        async with scheduler.slot_async(ClientIdentity("a"), 100):
+            waiting = asyncio.create_task(call("gone", ClientIdentity("b")))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert "gone" not in order
+        assert scheduler.in_use == 0 and scheduler.summary()["queued"] == 0
+
+    asyncio.run(run())
+    print("✅ Weighted fair queue passed")
+
+def check_job_fairness():
+    print("\n🧪 Testing fair job interleaving...")
+    release = threading.Event()
+    order = []
+
+    def handler(payload):
+        release.wait(5)
+        order.append(payload["name"])
+        return {}
+
+    manager = JobManager(handler, workers=1)
+    manager.start()
+    try:
+        blocker = manager.submit({"name": "blocker"}, client="a")
+        time.sleep(0.05)  # the worker is now busy with the blocker
+        jobs = [manager.submit({"name": f"a{i}"}, client="a") for i in range(3)]
+        jobs += [manager.submit({"name": f"b{i}"}, client="b") for i in range(2)]
+        jobs.append(manager.submit({"name": "urgent"}, priority=1, client="c"))
+        release.set()
+        for job in [blocker] + jobs:
+            assert job.done.wait(5)
+        assert order == ["blocker", "urgent", "a0", "b0", "a1", "b1", "a2"], order
+    finally:
+        manager.stop()
+    print("✅ Fair job interleaving passed")
+
+def test_scheduler():
+    check_identity()
+    check_quotas()
+    check_fair_queue()
+    check_job_fairness()
+
+if __name__ == "__main__":
+    test_scheduler()
@@ -0,0 +1,51 @@
+import time
+
+from state_store import CachedStateStore, InMemoryStateStore, RESPServer, RedisStateStore, create_state_store
+
+def check_store(store, name):
+    print(f"\n🧪 Testing {name}...")
+
+    store.set("session:a", "hello")
+    assert store.get("session:a") == "hello"
+    store.delete("session:a")
+    assert store.get("session:a") is None
+
+    store.set_json("session:b", [{"role": "user", "content": "Hi ✓"}], ttl=0.2)
+    assert store.get_json("session:b") == [{"role": "user", "content": "Hi ✓"}]
+    time.sleep(0.3)
+    assert store.get_json("session:b", []) == []
+
+    assert store.incr("counter:x") == 1
+    assert store.incr("counter:x", 4) == 5
+    assert store.count_in_window("client-1", window=60) == 1
+    assert store.count_in_window("client-1", window=60, amount=2) == 3
+    print(f"✅ {name} passed")
+
+def test_state_stores():
+    check_store(InMemoryStateStore(), "in-memory store")
+
+    server = RESPServer().start()
+    try:
+        check_store(RedisStateStore(port=server.port), "Redis-protocol store")
+
+        # Two replicas share state through the server
+        replica_a = create_state_store(f"redis://127.0.0.1:{server.port}/0", near_cache_ttl=60)
+        replica_b = create_state_store(f"redis://127.0.0.1:{server.port}/0", near_cache_ttl=60)
+        replica_a.set_json("session:shared", ["turn"])
+        assert replica_b.get_json("session:shared") == ["turn"]
+
+        # Cached answers are served from the client-side cache after the first read
+        replica_a.set("answer:q", "42")
+        assert replica_b.get("answer:q") == "42"
+        round_trips = replica_b.backend.round_trips
+        for _ in range(10):
+            assert replica_b.get("answer:q") == "42"
+        assert replica_b.backend.round_trips == round_trips
+        assert isinstance(replica_b, CachedStateStore) and replica_b.near_hits == 10
+        print("✅ Shared state and client-side cache passed")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    test_state_stores()